@@ -0,0 +1,13 @@
+"""
+Scaling benchmarks for xclingo.
+
+Every case is a synthetic program built by a generator of benchmarks.generators for a given size. The time spent in
+each phase of the explanation of the program is measured separately and written as JSON, so the results of two
+checkouts can be compared:
+
+    python -m benchmarks run -o before.json
+    python -m benchmarks run -o after.json
+    python -m benchmarks compare before.json after.json
+"""
+from .generators import CASES
+from ._run import run_case, run
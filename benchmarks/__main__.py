@@ -0,0 +1,47 @@
+from argparse import ArgumentParser, FileType
+import json
+import sys
+
+from .generators import CASES
+from ._run import run, compare
+
+
+def check_options():
+    parser = ArgumentParser(description="Scaling benchmarks for xclingo", prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Runs the benchmarks and writes the results as JSON.")
+    run_parser.add_argument("--case", action="append", choices=sorted(CASES), default=None,
+                            help="Case to run. It can be given several times. Default: all.")
+    run_parser.add_argument("--size", action="append", type=int, default=None,
+                            help="Size of the generated programs. It can be given several times. Default: the default sizes of each case.")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Repetitions of each case. Default: 3.")
+    run_parser.add_argument("--models", type=int, default=100,
+                            help="Maximum number of answer sets explained, 0 for all. Default: 100.")
+    run_parser.add_argument("--explanations", type=int, default=1,
+                            help="Maximum number of explanations for each answer set, 0 for all. Default: 1.")
+    run_parser.add_argument("-o", "--output", type=FileType("w"), default=sys.stdout,
+                            help="File where the results are written. Default: standard output.")
+
+    compare_parser = commands.add_parser("compare", help="Compares the results of two runs.")
+    compare_parser.add_argument("before", type=FileType("r"))
+    compare_parser.add_argument("after", type=FileType("r"))
+    return parser.parse_args()
+
+
+def main():
+    args = check_options()
+    if args.command == "run":
+        results = run(args.case, args.size, args.repeat, args.models, args.explanations)
+        json.dump(results, args.output, indent=2)
+        args.output.write("\n")
+    else:
+        before, after = json.load(args.before), json.load(args.after)
+        print(f"{'case':<16}{'size':>8}  {'phase':<10}{'before':>12}{'after':>12}{'ratio':>8}")
+        for case, size, phase, old, new in compare(before, after):
+            ratio = f"{new / old:.2f}" if old > 0 else "-"
+            print(f"{case:<16}{size:>8}  {phase:<10}{old:>12.4f}{new:>12.4f}{ratio:>8}")
+
+
+if __name__ == "__main__":
+    main()
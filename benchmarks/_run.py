@@ -0,0 +1,131 @@
+import platform
+from contextlib import contextmanager
+from time import perf_counter
+
+from clingo import __version__ as clingo_version
+
+from xclingo import XclingoControl, __version__ as xclingo_version
+from xclingo.preprocessor import Preprocessor
+
+from .generators import CASES
+
+# Only the public API is used, so that the benchmarks can be run against older checkouts.
+# annotate: rewriting the annotations into rules.
+# original: adding and grounding the original program.
+# explain: solving the original program and explaining every answer set (the translation is done on the first one).
+# render: printing the explanations with ascii_tree.
+PHASES = ("annotate", "original", "explain", "render")
+
+
+class _Timer:
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+
+    @contextmanager
+    def __call__(self, phase):
+        start = perf_counter()
+        yield
+        self.phases[phase] += perf_counter() - start
+
+
+def run_case(program, models=100, explanations=1):
+    """Explains a program and returns the seconds spent in each phase, together with the size of the output. If the
+    checkout records the phases of the explainer (see xclingo._stats.Stats), they are added to the phases, as parts
+    of the explain phase.
+
+    Args:
+        program (str): an annotated program.
+        models (int, optional): maximum number of answer sets to explain, 0 for all. Defaults to 100.
+        explanations (int, optional): maximum number of explanations for each answer set, 0 for all. Defaults to 1.
+
+    Returns:
+        dict: the times ('phases') and the number of answer sets, explanations and explanation nodes.
+    """
+    timer = _Timer()
+    with timer("annotate"):
+        Preprocessor.translate_annotations(program)
+
+    with timer("original"):
+        xcontrol = XclingoControl(str(models), str(explanations))
+        xcontrol.add("base", [], program)
+        xcontrol.ground()
+
+    n_models = 0
+    n_explanations = 0
+    n_nodes = 0
+    answers = iter(xcontrol.explain())
+    while True:
+        with timer("explain"):
+            answer = next(answers, None)
+            if answer is None:
+                break
+            answer = list(answer)
+        with timer("render"):
+            for expl in answer:
+                n_nodes += expl.ascii_tree().count("\n")
+        n_models += 1
+        n_explanations += len(answer)
+
+    phases = timer.phases
+    stats = getattr(xcontrol, "stats", None)
+    if stats is not None:
+        phases.update(stats.wall)
+
+    return dict(
+        phases=phases,
+        models=n_models,
+        explanations=n_explanations,
+        nodes=n_nodes,
+    )
+
+
+def run(cases=None, sizes=None, repeat=3, models=100, explanations=1):
+    """Runs the benchmark cases and returns the results as a JSON-serialisable dict. The time of each phase is the
+    best of the repetitions.
+
+    Args:
+        cases (Iterable[str], optional): names of the cases in benchmarks.generators.CASES. Defaults to all of them.
+        sizes (Iterable[int], optional): sizes for every case. Defaults to the default sizes of each case.
+        repeat (int, optional): number of times each case is run. Defaults to 3.
+        models (int, optional): maximum number of answer sets to explain, 0 for all. Defaults to 100.
+        explanations (int, optional): maximum number of explanations for each answer set. Defaults to 1.
+    """
+    results = []
+    for name in cases if cases is not None else CASES:
+        generator, default_sizes = CASES[name]
+        for size in sizes if sizes is not None else default_sizes:
+            program = generator(size)
+            best = None
+            for i in range(repeat):
+                # A different comment on every repetition keeps the translation caches of newer checkouts from
+                # reusing the translation of the previous one
+                result = run_case(f"{program}\n% repetition {i}\n", models=models, explanations=explanations)
+                if best is None:
+                    best = result
+                else:
+                    for phase, seconds in result["phases"].items():
+                        best["phases"][phase] = min(best["phases"][phase], seconds)
+            # The phases of the explainer are already part of the explain phase
+            best["phases"]["total"] = sum(best["phases"][phase] for phase in PHASES)
+            results.append(dict(case=name, size=size, **best))
+    return dict(
+        xclingo=xclingo_version,
+        clingo=clingo_version,
+        python=platform.python_version(),
+        repeat=repeat,
+        models=models,
+        explanations=explanations,
+        results=results,
+    )
+
+
+def compare(before, after):
+    """Yields (case, size, phase, seconds before, seconds after) for every phase of the cases run in both results."""
+    previous = {(r["case"], r["size"]): r for r in before["results"]}
+    for result in after["results"]:
+        old = previous.get((result["case"], result["size"]), None)
+        if old is None:
+            continue
+        for phase, seconds in result["phases"].items():
+            if phase in old["phases"]:
+                yield result["case"], result["size"], phase, old["phases"][phase], seconds
@@ -0,0 +1,61 @@
+"""Parametric generators of annotated programs. Each one returns the text of a program for the given size."""
+
+
+def chain(n):
+    """A single derivation chain of length n: the explanation of p(n) is n levels deep."""
+    return (
+        "p(0).\n"
+        '%!trace_rule {"p(%)",I}\n'
+        f"p(I+1) :- p(I), I<{n}.\n"
+        f"%!show_trace p({n}).\n"
+    )
+
+
+def diamond(n):
+    """examples/diamond.lp with n levels: every p(I) is derived both through a(I-1) and b(I-1)."""
+    return (
+        f"max({n}).\n"
+        "p(0).\n"
+        '%!trace_rule {"a(%)",N}\n'
+        "a(N) :- p(N),N<M,max(M).\n"
+        '%!trace_rule {"b(%)",N}\n'
+        "b(N) :- p(N), N<M,max(M).\n"
+        "p(N+1) :- a(N), N<M,max(M).\n"
+        "p(N+1) :- b(N), N<M,max(M).\n"
+        '%!trace {"p(%)",N} p(N).\n'
+        "%!show_trace p(N):max(N).\n"
+    )
+
+
+def choice(n):
+    """examples/pool_and_choice.lp with n switches, so the program has 2^n answer sets."""
+    return (
+        f"{{switch(1..{n})}}.\n"
+        '%!trace_rule {"bulb is OFF"}\n'
+        "bulb(off) :- not bulb(on).\n"
+        '%!trace_rule {"bulb is ON"}\n'
+        "bulb(on) :- switch(S), S\\2=1.\n"
+        '%!trace {"switch % is enabled",S} switch(S).\n'
+        "%!show_trace bulb(V).\n"
+    )
+
+
+def count_aggregate(n, entities=10, times=10):
+    """tests/test_xclingo/count_aggregate.lp with n objects held by each entity at each time point."""
+    return (
+        f"held_by(O,E,T) :- O=1..{n}, E=1..{entities}, T=0..{times - 1}, (O+E+T)\\3 != 0.\n"
+        "numberObjectsbyEntityatTime(N,E,T):- N=#count{O: held_by(O,E,T)}, entity(E),time(T).\n"
+        "time(T):-held_by(O,E,T).\n"
+        "entity(E):-held_by(O,E,T).\n"
+        '%!trace {"% is holding % items at time point %", E,N,T} numberObjectsbyEntityatTime(N,E,T).\n'
+        "%!show_trace numberObjectsbyEntityatTime(N,E,T).\n"
+    )
+
+
+# name: (generator, default sizes)
+CASES = {
+    "chain": (chain, (100, 1000)),
+    "diamond": (diamond, (10, 50)),
+    "choice": (choice, (8, 12)),
+    "count_aggregate": (count_aggregate, (10, 100)),
+}
@@ -141,22 +141,11 @@ class TestPreprocessor:
                 '_xclingo_sup',
                 [
                     ast.SymbolicTerm(loc, Number(rule_id)),
-                    ast.SymbolicAtom(ast.Function(loc, 'b', [], False)),
+                    ast.Function(loc, 'b', [], False),
                     ast.Function(
                         loc,
                         '',
-                        [
-                            ast.Literal(
-                                loc,
-                                ast.Sign.NoSign,
-                                ast.SymbolicAtom(ast.Function(loc, "person",[ast.Variable(loc, 'P')],False)),
-                            ),
-                            ast.Literal(
-                                loc,
-                                ast.Sign.NoSign,
-                                ast.SymbolicAtom(ast.Function(loc, "hola",[],False)),
-                            )
-                        ],
+                        [ast.Variable(loc, 'P'), ast.Function(loc, 'hola', [], False)],
                         False,
                     )
                 ],
@@ -180,22 +169,11 @@ class TestPreprocessor:
                 '_xclingo_fbody',
                 [
                     ast.SymbolicTerm(loc, Number(rule_id)),
-                    ast.SymbolicAtom(ast.Function(loc, 'b', [], False)),
+                    ast.Function(loc, 'b', [], False),
                     ast.Function(
                         loc,
                         '',
-                        [
-                            ast.Literal(
-                                loc,
-                                ast.Sign.NoSign,
-                                ast.SymbolicAtom(ast.Function(loc, "person",[ast.Variable(loc, 'P')],False)),
-                            ),
-                            ast.Literal(
-                                loc,
-                                ast.Sign.NoSign,
-                                ast.SymbolicAtom(ast.Function(loc, "hola",[],False)),
-                            )
-                        ],
+                        [ast.Variable(loc, 'P'), ast.Function(loc, 'hola', [], False)],
                         False,
                     )
                 ],
@@ -292,18 +270,7 @@ class TestPreprocessor:
                             ast.Function(
                                 loc,
                                 '',
-                                [
-                                    ast.Literal(
-                                        loc,
-                                        ast.Sign.NoSign,
-                                        ast.SymbolicAtom(ast.Function(loc, "person",[ast.Variable(loc, 'P')],False)),
-                                    ),
-                                    ast.Literal(
-                                        loc,
-                                        ast.Sign.NoSign,
-                                        ast.SymbolicAtom(ast.Function(loc, "hola",[],False)),
-                                    )
-                                ],
+                                [ast.Variable(loc, 'P'), ast.Function(loc, 'hola', [], False)],
                                 False,
                             )
 
@@ -686,3 +653,49 @@ class TestPreprocessor:
         preprocessor = Preprocessor()
         rule = preprocessor.show_trace(custom_show_trace)
         assert expected_show_trace == rule
+
+    @staticmethod
+    def translated_heads(program):
+        preprocessor = Preprocessor()
+        preprocessor.translate_program(program)
+        return [
+            str(rule.head.atom.symbol.arguments[1])
+            for rule in preprocessor.get_translation_ast()
+            if rule.ast_type == ast.ASTType.Rule and rule.head.atom.symbol.name == '_xclingo_sup'
+        ]
+
+    def test_slicing(self):
+        program = 'a. b :- a. c :- b, not d. d :- e. e. f :- e.\n%!show_trace c.'
+        assert self.translated_heads(program) == ['a', 'b', 'c']
+        assert self.translated_heads(program.replace('%!show_trace c.', '%!show_trace f.')) == ['e', 'f']
+
+    def test_slicing_mute(self):
+        program = 'a. b :- a. c :- b.\n%!show_trace c.\n%!mute b(X).\n'
+        assert self.translated_heads(program) == ['a', 'b', 'c']
+        assert self.translated_heads(program.replace('b(X)', 'b')) == ['b', 'c']
+
+    def test_mute_label_rule(self):
+        # The label of a muted predicate takes its variables from the head and the body of the rule
+        preprocessor = Preprocessor()
+        preprocessor.translate_program('p(1). %!trace_rule {"a(%)",N}\na(N) :- p(N).\n%!show_trace a(N).\n%!mute a(N).')
+        label_rules = [
+            str(rule)
+            for rule in preprocessor.get_translation_ast()
+            if rule.ast_type == ast.ASTType.Rule and rule.head.atom.symbol.name == '_xclingo_label'
+        ]
+        assert label_rules == [
+            '_xclingo_label(a(N),("a(%)",(N,))) :- _xclingo_f(2,a(N),empty); _xclingo_model(p(N)).',
+        ]
+
+    def test_body_rules(self):
+        preprocessor = Preprocessor()
+        preprocessor.translate_program('p(X) :- q(X,_), r. q(1,2). r.\n%!show_trace p(X).')
+        body_rules = [
+            str(rule)
+            for rule in preprocessor.get_translation_ast()
+            if rule.ast_type == ast.ASTType.Rule and rule.head.atom.symbol.name == '_xclingo_body'
+        ]
+        assert body_rules == [
+            '_xclingo_body(1,(X,_XclingoAnon1,r),0,q(X,_XclingoAnon1)) :- _xclingo_sup(1,_,(X,_XclingoAnon1,r)).',
+            '_xclingo_body(1,(X,_XclingoAnon1,r),1,r) :- _xclingo_sup(1,_,(X,_XclingoAnon1,r)).',
+        ]
@@ -0,0 +1,67 @@
+import pytest
+
+from xclingo import Explainer
+from xclingo.preprocessor import Preprocessor, TranslationCache
+
+class TestTranslationCache:
+
+    def test_key(self):
+        programs = [('base', [], 'a. b :- a.')]
+        assert TranslationCache.key(programs, 'none') == TranslationCache.key(list(programs), 'none')
+        assert TranslationCache.key(programs, 'none') != TranslationCache.key(programs, 'all')
+        assert TranslationCache.key(programs, 'none') != TranslationCache.key([('base', [], 'a. b :- not a.')], 'none')
+        assert TranslationCache.key(programs, 'none') != TranslationCache.key([('step', ['t'], 'a. b :- a.')], 'none')
+
+    def test_disk_cache(self, tmp_path):
+        key = TranslationCache.key([('base', [], 'a.')], 'test_disk_cache')
+        preprocessor = Preprocessor()
+        preprocessor.translate_program('a. b :- a.\n%!show_trace b.')
+        translation = preprocessor.get_translation_ast()
+        TranslationCache(cache_dir=str(tmp_path)).set(key, translation)
+        TranslationCache._memo.clear()
+
+        assert TranslationCache().get(key) is None
+        expected = [str(a) for a in translation]
+        assert [str(a) for a in TranslationCache(cache_dir=str(tmp_path)).get(key)] == expected
+        assert [str(a) for a in TranslationCache().get(key)] == expected
+
+    def test_translation_is_reused(self):
+        explainer = Explainer()
+        explainer.add('base', [], 'a. b :- a.\n%!show_trace b.')
+        translation = explainer._get_translation()
+        explainer._translate_program()
+        assert explainer._get_translation() == translation
+
+        explainer.add('base', [], 'b :- c. c.')
+        assert explainer._get_translation() != translation
+
+    def test_warnings_on_cache_hit(self, capsys, monkeypatch, tmp_path):
+        import xclingo.preprocessor._preprocessor as preprocessor_module
+        program = '%!trace_rul {"a"}\na.\n%!show_trace a.\n'
+        for _ in range(2):
+            explainer = Explainer(cache_dir=str(tmp_path))
+            explainer.add('base', [], program)
+            explainer._get_translation()
+            assert 'unrecognised annotation at base:1:1: %!trace_rul {"a"}' in capsys.readouterr().out
+            # The warnings of a cached translation are replayed without scanning the program again
+            monkeypatch.setattr(preprocessor_module, 'scan_annotations', None)
+
+        TranslationCache._memo.clear()
+        explainer = Explainer(cache_dir=str(tmp_path))
+        explainer.add('base', [], program)
+        explainer._get_translation()
+        assert 'unrecognised annotation at base:1:1: %!trace_rul {"a"}' in capsys.readouterr().out
+
+    def test_resumed_translation(self):
+        rules = 'b(X) :- a(X).\n%!show_trace b(X).\n'
+        base = Explainer()
+        base.add('base', [], rules)
+        base_translation = base._get_translation()
+
+        instance = Explainer()
+        instance.add('base', [], rules)
+        instance.add('base', [], 'a(1).')
+        translation = instance._get_translation()
+        # The rules of the rule base are not translated again
+        assert all(any(a is b for b in translation) for a in base_translation if a.ast_type.name == 'Rule')
+        assert len(translation) > len(base_translation)
@@ -1,6 +1,7 @@
 import pytest
 
-from xclingo.preprocessor._utils import translate_show_all, translate_trace_all, translate_trace
+from clingo.ast import parse_string
+from xclingo.preprocessor._utils import translate_show_all, translate_trace_all, translate_trace, scan_annotations, model_signatures
 
 class TestUtils:
 
@@ -24,3 +25,27 @@ class TestUtils:
         print('--------')
         print(expected_text)
         assert expected_text == translated
+
+    def test_scan_annotations(self, datadir):
+        input_text = (datadir / 'test_trace_input').read_text()
+        input_text += '%!show_trace punish(P).\n  %!trace {"p"} p\n% the %!trace annotation\n'
+        translated, annotations = scan_annotations(input_text)
+        assert [(a.kind, a.line, a.column) for a in annotations] == [
+            ('trace_rule', 1, 1),
+            ('trace_rule', 4, 1),
+            ('show_trace', 6, 1),
+            (None, 7, 3),
+        ]
+        assert translated.startswith((datadir / 'test_trace_output').read_text())
+        assert translated.endswith('_xclingo_show_trace(punish(P)).\n  %!trace {"p"} p\n% the %!trace annotation\n')
+
+        translated, _ = scan_annotations('%!trace {"x"} x.\n')
+        assert translated == '_xclingo_label(x, ("x", (,)) ).\n'
+
+    def test_model_signatures(self):
+        statements = []
+        parse_string('a :- _xclingo_model(b(X)), not _xclingo_model(-c). d :- e.', statements.append)
+        assert model_signatures(statements) == {('b', 1), ('c', 0)}
+
+        parse_string('f :- _xclingo_model(X), g(X).', statements.append)
+        assert model_signatures(statements) is None
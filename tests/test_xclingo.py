@@ -1,22 +1,417 @@
 import pytest
 
+from clingo import Number
+
 from xclingo import XclingoControl, XclingoContext
 
 class TestXclingo:
 
-    def assert_test_case(self, datadir, test_case, auto_tracing):
-        xcontrol = XclingoControl(
-            n_solutions=0,
-            n_explanations=0,
-            auto_trace=auto_tracing,
-        )
+    @staticmethod
+    def explanation_blocks(output):
+        lines = [line for line in output.splitlines() if not line.startswith('Answer')]
+        return sorted(b.strip('\n') for b in '\n'.join(lines).split('\n\n') if b.strip())
+
+    def assert_test_case(self, datadir, test_case, auto_tracing, ignore_order=False, **kwargs):
+        xcontrol = XclingoControl(**dict(
+            dict(n_solutions=0, n_explanations=0, auto_trace=auto_tracing),
+            **kwargs,
+        ))
         xcontrol.add('base', [], (datadir / f'{test_case}.lp').read_text())
         xcontrol.ground()
         
         result = xcontrol._default_output()
         expected = (datadir / f'expected_{test_case}.txt').read_text()
-        assert expected == result
+        if ignore_order:
+            assert self.explanation_blocks(expected) == self.explanation_blocks(result)
+        else:
+            assert expected == result
 
     def test_count_aggregate(self, datadir):
         self.assert_test_case(datadir, 'count_aggregate', 'none')
-        self.assert_test_case(datadir, 'ignore_shows', 'all')
\ No newline at end of file
+        self.assert_test_case(datadir, 'ignore_shows', 'all')
+
+    def test_persistent(self, datadir):
+        self.assert_test_case(datadir, 'count_aggregate', 'none', ignore_order=True, persistent=True)
+        self.assert_test_case(datadir, 'ignore_shows', 'all', ignore_order=True, persistent=True)
+
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0, persistent=True)
+        xcontrol.add('base', [], 'a.')
+        xcontrol.ground()
+        with pytest.raises(ValueError):
+            xcontrol.explainer.explain_symbols([])
+
+        # The explanations of each answer set may be consumed after the following answer sets are found
+        program = '1{c(1..3)}1.\n%!trace_rule {"a %",X}\na(X) :- c(X).\n%!show_trace a(X).\n'
+        answers = dict()
+        for persistent in (False, True):
+            xcontrol = XclingoControl(n_solutions=0, n_explanations=0, persistent=persistent)
+            xcontrol.add('base', [], program)
+            xcontrol.ground()
+            answers[persistent] = [[e.ascii_tree() for e in answer] for answer in list(xcontrol.explain())]
+        assert sorted(answers[True]) == sorted(answers[False])
+        assert len({tuple(answer) for answer in answers[True]}) == 3
+
+    def test_joint(self, datadir):
+        self.assert_test_case(datadir, 'count_aggregate', 'none', ignore_order=True, joint=True)
+        self.assert_test_case(datadir, 'ignore_shows', 'all', ignore_order=True, joint=True)
+
+        # a and d have two explanations each: the joint mode returns each one once, not every combination of them
+        program = 'b. c.\n'
+        for head in ('a', 'd'):
+            for body in ('b', 'c'):
+                program += f'%!trace_rule {{"{head} from {body}"}}\n{head} :- {body}.\n'
+        program += '%!show_trace a.\n%!show_trace d.\n'
+        trees = dict()
+        for joint in (False, True):
+            for n_explanations in (0, 1):
+                xcontrol = XclingoControl(n_solutions=0, n_explanations=n_explanations, joint=joint)
+                xcontrol.add('base', [], program)
+                xcontrol.ground()
+                trees[joint, n_explanations] = sorted(e.ascii_tree() for answer in xcontrol.explain() for e in answer)
+        assert len(trees[False, 0]) == 4
+        assert trees[True, 0] == trees[False, 0]
+        # One explanation of every atom
+        assert [t.split('__')[1][0] for t in trees[True, 1]] == ['a', 'd']
+
+    def test_graph_engine(self, datadir):
+        self.assert_test_case(datadir, 'count_aggregate', 'none', ignore_order=True, engine='graph', n_explanations=1)
+        self.assert_test_case(datadir, 'ignore_shows', 'all', ignore_order=True, engine='graph', n_explanations=1)
+
+        # The graph engine only builds the first explanation of each atom
+        with pytest.raises(ValueError):
+            XclingoControl(n_solutions=0, n_explanations=0, engine='graph')
+
+    def test_lazy(self, datadir):
+        self.assert_test_case(datadir, 'count_aggregate', 'none', lazy=True)
+        self.assert_test_case(datadir, 'ignore_shows', 'all', ignore_order=True, lazy=True, joint=True)
+
+    def test_lazy_materialization(self):
+        from clingo import Function, String
+        from xclingo.explanation import Explanation
+        root, a, b = Function('root'), Function('a'), Function('b')
+        symbols = [
+            Function('_xclingo_label_tree', [root, a, String('a')]),
+            Function('_xclingo_label_tree', [a, b, String('b')]),
+        ]
+        explanation = Explanation.from_model(symbols, lazy=True)
+        assert explanation.causes._items is None
+        node_a = explanation.causes[0]
+        assert node_a.causes._items is None
+        assert explanation.ascii_tree() == Explanation.from_model(symbols).ascii_tree()
+
+    def test_empty_answer(self):
+        # An answer set without explanations is followed by a blank line, as any other answer set
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+        xcontrol.add('base', [], '{b}.\n%!trace_rule {"a"}\na :- b.\n%!show_trace a.\n')
+        xcontrol.ground()
+        assert xcontrol._default_output() == 'Answer 1\n\nAnswer 2\n  *\n  |__a\n\n'
+
+    def test_distinct(self):
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+        xcontrol.add('base', [], '{c}. b.\n%!trace_rule {"a"}\na :- b.\n%!show_trace a.\n')
+        xcontrol.ground()
+        distinct = xcontrol.explain_distinct()
+        assert len(distinct) == 1
+        expl, answers = distinct[0]
+        assert answers == [1, 2]
+        assert expl.ascii_tree() == '  *\n  |__a\n'
+
+    def test_memo(self, datadir):
+        self.assert_test_case(datadir, 'count_aggregate', 'none', memo_size=4)
+
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0, memo_size=4)
+        xcontrol.add('base', [], '{c}. {b}.\n%!trace_rule {"a"}\na :- b.\n%!show_trace a.\n')
+        xcontrol.ground()
+        trees = sorted(''.join(e.ascii_tree() for e in answer) for answer in xcontrol.explain())
+        assert trees == ['', '', '  *\n  |__a\n', '  *\n  |__a\n']
+        # c is not relevant to the explanations of a: the models with and without it share them
+        assert xcontrol.stats.models == 4
+        assert xcontrol.stats.reused == 2
+
+    def test_explain_async(self, datadir):
+        import asyncio
+
+        def control(**kwargs):
+            xcontrol = XclingoControl(n_solutions=0, n_explanations=0, **kwargs)
+            xcontrol.add('base', [], (datadir / 'count_aggregate.lp').read_text())
+            xcontrol.ground()
+            return xcontrol
+
+        async def collect(xcontrol):
+            return [sorted(e.ascii_tree() for e in answer) async for answer in xcontrol.explain_async(timeout=60)]
+
+        expected = sorted(sorted(e.ascii_tree() for e in answer) for answer in control().explain())
+        assert sorted(asyncio.run(collect(control()))) == expected
+        assert sorted(asyncio.run(collect(control(persistent=True)))) == expected
+        assert sorted(asyncio.run(collect(control(joint=True)))) == expected
+
+        # The search of the original program does not get ahead of a slow consumer
+        async def consume_slowly(xcontrol, n):
+            answers = xcontrol.explain_async()
+            for _ in range(n):
+                await answers.__anext__()
+                await asyncio.sleep(0.05)
+            await answers.aclose()
+
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+        xcontrol.add('base', [], '{c(1..16)}.\n%!trace_rule {"a %",X}\na(X) :- c(X).\n%!show_trace a(X).\n')
+        xcontrol.ground()
+        asyncio.run(consume_slowly(xcontrol, 3))
+        assert xcontrol.control.statistics['summary']['models']['enumerated'] <= 3 + 2
+
+        # Cancelling the consuming task stops the search, so the control can solve again right away
+        async def cancel(xcontrol):
+            first = asyncio.get_event_loop().create_future()
+            async def consume():
+                async for answer in xcontrol.explain_async():
+                    if not first.done():
+                        first.set_result(answer)
+            task = asyncio.ensure_future(consume())
+            await first
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return list(next(iter(xcontrol.explain())))
+
+        for kwargs in (dict(), dict(persistent=True)):
+            xcontrol = XclingoControl(n_solutions=0, n_explanations=0, **kwargs)
+            xcontrol.add('base', [], '{c(1..16)}.\n%!trace_rule {"a %",X}\na(X) :- c(X).\n%!show_trace a(X).\n')
+            xcontrol.ground()
+            assert asyncio.run(cancel(xcontrol)) == []
+
+    def test_server(self, datadir, tmp_path):
+        import threading, time
+        from xclingo._server import ExplanationServer, request_explanations
+        program = (datadir / 'count_aggregate.lp').read_text()
+        expected = XclingoControl(n_solutions=0, n_explanations=0)
+        expected.add('base', [], program)
+        expected.ground()
+        expected = expected._default_output()
+
+        server = ExplanationServer(program, n_solutions='0', n_explanations='0')
+        assert server.explain('') == expected
+
+        address = f"unix:{tmp_path / 'xclingo.sock'}"
+        threading.Thread(target=server.serve_forever, args=(address,), daemon=True).start()
+        for _ in range(100):
+            if (tmp_path / 'xclingo.sock').exists():
+                break
+            time.sleep(0.05)
+        assert request_explanations(address, '') == expected
+        with pytest.raises(RuntimeError):
+            request_explanations(address, 'a(')
+
+    def test_server_translates_rules_once(self, monkeypatch):
+        from xclingo import Explainer
+        from xclingo._server import ExplanationServer
+        from xclingo.preprocessor import Preprocessor
+        rules = '%!trace_rule {"a %", X}\na(X) :- b(X), test_server_translates_rules_once.\n%!show_trace a(X).\n'
+        translated = []
+        translate_program = Preprocessor.translate_program
+        def counting_translate_program(self, program, *args, **kwargs):
+            translated.append(program)
+            return translate_program(self, program, *args, **kwargs)
+        monkeypatch.setattr(Preprocessor, 'translate_program', counting_translate_program)
+
+        server = ExplanationServer(rules, n_solutions='0', n_explanations='0')
+        for i in range(2 * Explainer.preprocessors_size):
+            assert server.explain(f'b({i}). test_server_translates_rules_once.').count(f'  |__a {i}\n') == 1
+        assert translated.count(rules) == 1
+
+    def test_json_output(self, datadir):
+        import json
+        from io import StringIO
+
+        def output(output_format):
+            xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+            xcontrol.add('base', [], (datadir / 'count_aggregate.lp').read_text())
+            xcontrol.ground()
+            out = StringIO()
+            xcontrol.write_explanations(out, flush=False, output_format=output_format)
+            return out.getvalue()
+
+        records = [json.loads(line) for line in output('ndjson').splitlines()]
+        assert records == json.loads(output('json'))
+        assert len(records) == output('text').count('  *\n')
+        for record in records:
+            assert record['answer'] == 1
+            assert record['nodes'][0] == {'id': 0, 'labels': []}
+            assert len(record['edges']) == len(record['nodes']) - 1
+        assert [r['explanation'] for r in records] == list(range(1, len(records) + 1))
+
+        # Answer sets without explanations are reported too
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+        xcontrol.add('base', [], '{b}.\n%!trace_rule {"a"}\na :- b.\n%!show_trace a.\n')
+        xcontrol.ground()
+        out = StringIO()
+        xcontrol.write_explanations(out, flush=False, output_format='ndjson')
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert records[0] == {'answer': 1, 'explanations': 0}
+        assert (records[1]['answer'], records[1]['explanation']) == (2, 1)
+
+    def test_binary_export(self, datadir, tmp_path):
+        from xclingo.explanation import ExplanationReader
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+        xcontrol.add('base', [], (datadir / 'count_aggregate.lp').read_text())
+        xcontrol.ground()
+        expected = [[e.ascii_tree() for e in answer] for answer in xcontrol.explain()]
+
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+        xcontrol.add('base', [], (datadir / 'count_aggregate.lp').read_text())
+        xcontrol.ground()
+        with open(tmp_path / 'explanations.bin', 'wb') as fp:
+            xcontrol.export_explanations(fp)
+
+        with ExplanationReader(tmp_path / 'explanations.bin') as reader:
+            assert len(reader) == len(expected)
+            assert reader.count(0) == len(expected[0])
+            assert reader.explanation(0, len(expected[0]) - 1).ascii_tree() == expected[0][-1]
+            assert [[e.ascii_tree() for e in answer] for answer in reader] == expected
+            with pytest.raises(IndexError):
+                reader.explanation(len(expected), 0)
+
+    def test_batch(self, datadir, tmp_path):
+        import json, os
+        from xclingo._batch import explain_batch
+        rules = '{c}.\n%!trace_rule {"a %", X}\na(X) :- b(X).\n%!show_trace a(X).\n'
+        paths = []
+        for i in range(3):
+            (tmp_path / f'instance{i}.lp').write_text(f'b({i}).')
+            paths.append(str(tmp_path / f'instance{i}.lp'))
+
+        for jobs in (1, 2):
+            outputs = list(explain_batch(rules, paths, jobs=jobs, n_solutions='0', n_explanations='0'))
+            assert [path for path, _ in outputs] == paths
+            for i, (_, output) in enumerate(outputs):
+                assert output.count(f'  *\n  |__a {i}\n') == 2
+
+        outputs = list(explain_batch(rules, paths[:1], output_format='ndjson', n_solutions='0'))
+        assert json.loads(outputs[0][1].splitlines()[0])['instance'] == paths[0]
+
+        # Instances with the same name in different directories are written to different files
+        from xclingo.__main__ import batch_output_names
+        nested = [str(tmp_path / 'a' / 'instance.lp'), str(tmp_path / 'b' / 'instance.lp')]
+        assert batch_output_names(nested, 'json') == [os.path.join('a', 'instance.json'), os.path.join('b', 'instance.json')]
+        assert batch_output_names(paths, 'text') == [f'instance{i}.txt' for i in range(3)]
+
+    def test_explanation_table(self):
+        from xclingo.explanation import ExplanationTable
+        from xclingo.explanation._explanation import ExplanationRoot, ExplanationNode
+        def tree(*labels):
+            return ExplanationRoot(causes=[ExplanationNode(labels={'p'}, causes=[ExplanationNode(labels={l}) for l in labels])])
+        first, second, other = tree('q', 'r'), tree('r', 'q'), tree('q')
+        assert first.is_equal(second)
+        assert not first.is_equal(other)
+        assert first.causes[0]._node_equals(second.causes[0])
+
+        table = ExplanationTable()
+        assert table.canonical(first) is first
+        assert table.canonical(second) is first
+        assert table.canonical(other) is not first
+        assert other.causes[0].causes[0] is first.causes[0].causes[0]
+        assert len(table) == 6
+
+    def test_workers_diagnostics(self, capfd):
+        # The workers print the same warnings and clingo messages as a single process
+        program = '{c(1..3)}.\n%!trace_rul {"a"}\n%!trace_rule {"a %",X}\na(X) :- c(X).\n%!show_trace a(X).\n'
+        for persistent in (False, True):
+            outputs = []
+            for workers in (1, 2):
+                xcontrol = XclingoControl(n_solutions=0, n_explanations=0, workers=workers, persistent=persistent)
+                xcontrol.add('base', [], program)
+                xcontrol.ground()
+                capfd.readouterr()
+                xcontrol._default_output()
+                out = capfd.readouterr().out
+                outputs.append(sorted(line for line in out.splitlines() if line.strip()))
+                assert out.count('unrecognised annotation') <= 1
+            assert outputs[0] == outputs[1]
+
+    def test_workers(self, datadir):
+        self.assert_test_case(datadir, 'count_aggregate', 'none', workers=2)
+        self.assert_test_case(datadir, 'ignore_shows', 'all', ignore_order=True, workers=2, persistent=True)
+        self.assert_test_case(datadir, 'ignore_shows', 'all', ignore_order=True, workers=2, ordered=False)
+
+        # Several answer sets: the workers keep their order, unless ordered=False
+        program = '{c(1..3)}.\n%!trace_rule {"a %",X}\na(X) :- c(X).\n%!show_trace a(X).\n'
+        def answers(**kwargs):
+            xcontrol = XclingoControl(n_solutions=0, n_explanations=0, **kwargs)
+            xcontrol.add('base', [], program)
+            xcontrol.ground()
+            output = xcontrol._default_output().split('Answer ')[1:]
+            return [self.explanation_blocks(answer.partition('\n')[2]) for answer in output]
+
+        expected = answers()
+        assert len(expected) == 8
+        assert answers(workers=2) == expected
+        assert answers(workers=2, persistent=True) == expected
+        assert sorted(answers(workers=2, ordered=False)) == sorted(expected)
+
+    def test_multi_shot(self):
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+        xcontrol.add('base', [], 'a(0).\n%!trace {"a(%)",T} a(T).\n%!show_trace a(T).')
+        xcontrol.add('step', ['t'], 'a(t) :- a(t-1).')
+        xcontrol.ground()
+        assert self.explanation_blocks(xcontrol._default_output()) == ['  *\n  |__a(0)']
+
+        xcontrol.ground(parts=[('step', [Number(1)])])
+        assert self.explanation_blocks(xcontrol._default_output()) == [
+            '  *\n  |__a(0)',
+            '  *\n  |__a(1)\n  |  |__a(0)',
+        ]
+
+    def test_mute_trace_rule(self):
+        # A muted predicate may still have a parameterised trace_rule
+        program = 'p(0).\n%!trace_rule {"a(%)",N}\na(N) :- p(N), N<1.\n%!trace {"p(%)",N} p(N).\np(N+1) :- a(N).\n' \
+            '%!show_trace p(N).\n%!mute a(N).\n'
+        # The graph engine builds a single explanation of each atom
+        for engine, n_explanations in (('asp', 0), ('graph', 1)):
+            xcontrol = XclingoControl(n_solutions=0, n_explanations=n_explanations, engine=engine)
+            xcontrol.add('base', [], program)
+            xcontrol.ground()
+            assert self.explanation_blocks(xcontrol._default_output()) == ['  *\n  |__p(0)', '  *\n  |__p(1)']
+
+    def test_body_instances(self):
+        # Instances of a rule without variables, from a pool or from several steps, must not share their body atoms
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0)
+        xcontrol.add('base', [], 'p(1;2).\na :- p(1;2).\n%!trace {"p(%)",X} p(X).\n%!show_trace a.')
+        xcontrol.ground()
+        assert self.explanation_blocks(xcontrol._default_output()) == ['  *\n  |__p(1)', '  *\n  |__p(2)']
+
+        # The graph engine builds a single explanation of each atom
+        for engine, n_explanations in (('asp', 0), ('graph', 1)):
+            xcontrol = XclingoControl(n_solutions=0, n_explanations=n_explanations, engine=engine)
+            xcontrol.add('base', [], 'a(0).\n%!trace {"a(%)",T} a(T).\n%!show_trace a(T).')
+            xcontrol.add('step', ['t'], 'a(t) :- a(t-1).')
+            xcontrol.ground()
+            xcontrol.ground(parts=[('step', [Number(1)])])
+            xcontrol.ground(parts=[('step', [Number(2)])])
+            assert self.explanation_blocks(xcontrol._default_output()) == [
+                '  *\n  |__a(0)',
+                '  *\n  |__a(1)\n  |  |__a(0)',
+                '  *\n  |__a(2)\n  |  |__a(1)\n  |  |  |__a(0)',
+            ]
+
+    def test_stats(self, datadir):
+        xcontrol = XclingoControl(n_solutions=0, n_explanations=0, statistics=True)
+        xcontrol.add('base', [], (datadir / 'count_aggregate.lp').read_text())
+        xcontrol.ground()
+        xcontrol._default_output()
+        stats = xcontrol.stats.as_dict()
+        assert stats['models'] == 1
+        assert stats['wall']['ground'] > 0
+        assert stats['original']['problem']['lp']['atoms'] > 0
+        assert stats['explainer']['problem']['lp']['atoms'] > 0
+        assert xcontrol.stats.summary().startswith('Explainer statistics\n')
+
+    def test_deep_explanation(self):
+        from xclingo.explanation._explanation import ExplanationRoot, ExplanationNode
+        root = ExplanationRoot()
+        node = root
+        for i in range(5000):
+            cause = ExplanationNode(labels={str(i)})
+            node.add_cause(cause)
+            node = cause
+        lines = root.ascii_tree().splitlines()
+        assert len(lines) == 5001
+        assert lines[-1] == '  |' * 5000 + '__4999'
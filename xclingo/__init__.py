@@ -1,4 +1,31 @@
+import sys
+
 from ._version import __version__
-from ._main import Explainer
-from ._main import XclingoControl
-from ._main import Context as XclingoContext
+
+# The explainer (and clingo) are only imported when they are first used, so that the thin client of the explanation
+# server (python -m xclingo --connect) starts quickly
+_EXPORTS = {
+    "Explainer": ("xclingo._main", "Explainer"),
+    "XclingoControl": ("xclingo._main", "XclingoControl"),
+    "XclingoContext": ("xclingo._main", "Context"),
+    "XclingoStats": ("xclingo._stats", "Stats"),
+}
+
+if sys.version_info < (3, 7):
+    # Modules can not define __getattr__ (PEP 562)
+    from ._main import Explainer
+    from ._main import XclingoControl
+    from ._main import Context as XclingoContext
+    from ._stats import Stats as XclingoStats
+else:
+    def __getattr__(name):
+        if name not in _EXPORTS:
+            raise AttributeError(f"module 'xclingo' has no attribute '{name}'")
+        from importlib import import_module
+        module, attribute = _EXPORTS[name]
+        value = getattr(import_module(module), attribute)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(list(globals()) + list(_EXPORTS))
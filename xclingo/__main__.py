@@ -1,7 +1,6 @@
-from xclingo import Explainer as Explainer
-from xclingo import XclingoControl
 from xclingo import __version__ as xclingo_version
 from argparse import ArgumentParser, FileType
+import os
 import sys
 
 def check_options():
@@ -19,35 +18,150 @@ def check_options():
                         help="Prints the atoms used by the explainer to build the explanations.")
     parser.add_argument('--auto-tracing', type=str, choices=["none", "facts", "all"], default="none",
                         help="Automatically creates traces for the rules of the program. Default: none.")
-    parser.add_argument('-n', nargs=2, default=(1,1), type=int, help="Number of answer sets and number of desired explanations.")
-    parser.add_argument('infiles', nargs='+', type=FileType('r'), default=sys.stdin, help="ASP program")
-    return parser.parse_args()
+    parser.add_argument('--persistent', action='store_true',
+                        help="Grounds the explainer once and reuses it for every answer set.")
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help="Directory where translations are cached between runs.")
+    parser.add_argument('--joint', action='store_true',
+                        help="Explains all the atoms of an answer set in a single solve. Explanations may share subtrees.")
+    parser.add_argument('--engine', type=str, choices=["asp", "graph"], default="asp",
+                        help="Explanation engine. 'graph' builds the first explanation of each atom without solving. Default: asp.")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Number of processes used to explain the answer sets. Default: 1.")
+    parser.add_argument('--unordered', action='store_true',
+                        help="With --jobs, prints the answer sets as soon as they are explained instead of in order.")
+    parser.add_argument('--memo', type=int, default=0,
+                        help="Number of answer sets whose explanations are kept, to be reused by later answer sets that agree on every atom relevant to them. Default: 0.")
+    parser.add_argument('--output-format', type=str, choices=["text", "json", "ndjson"], default="text",
+                        help="Format of the explanations: ascii trees, a JSON array, or one JSON object per line and explanation. Default: text.")
+    parser.add_argument('--export', type=FileType('wb'), metavar='FILE', default=None,
+                        help="Writes the explanations to FILE in a compact binary format instead of printing them.")
+    parser.add_argument('--distinct', action='store_true',
+                        help="Prints each distinct explanation once, with the answer sets it belongs to.")
+    parser.add_argument('--stats', action='store_true',
+                        help="Prints the time spent in each phase and the grounding statistics after the explanations.")
+    server_group = parser.add_mutually_exclusive_group()
+    server_group.add_argument('--serve', type=str, metavar='ADDRESS', default=None,
+                        help="Translates the input files once and serves explanations for instances sent by clients. ADDRESS is unix:PATH or [HOST:]PORT.")
+    server_group.add_argument('--connect', type=str, metavar='ADDRESS', default=None,
+                        help="Sends the input files as an instance to the server at ADDRESS and prints its explanations.")
+    server_group.add_argument('--batch', nargs='+', type=str, metavar='FILE', default=None,
+                        help="Takes the first FILE as the rule base and explains each other FILE as an instance of it. The files are opened one at a time. --jobs processes share the instances.")
+    parser.add_argument('--output-dir', type=str, metavar='DIR', default=None,
+                        help="In batch mode, writes the explanations of each instance to its own file in DIR, at its path relative to the directory that contains all the instances.")
+    parser.add_argument('-n', nargs=2, default=None, type=int, help="Number of answer sets and number of desired explanations. Default: 1 1, or the ones of the server with --connect.")
+    parser.add_argument('infiles', nargs='*', type=FileType('r'), help="ASP program")
+    args = parser.parse_args()
+    if args.n is None and args.connect is None:
+        args.n = (1, 1)
+    if args.engine == "graph" and args.n is not None and args.n[1] != 1:
+        parser.error("--engine graph only builds the first explanation of each atom: the number of explanations must be 1")
+    if args.output_format != "text":
+        text_only = [
+            option for option, given in (
+                ("--only-translate", args.only_translate),
+                ("--only-translate-annotations", args.only_translate_annotations),
+                ("--only-explanation-atoms", args.only_explanation_atoms),
+                ("--export", args.export is not None),
+                ("--distinct", args.distinct),
+                ("--serve", args.serve is not None),
+                ("--connect", args.connect is not None),
+            ) if given
+        ]
+        if text_only:
+            parser.error(f"--output-format {args.output_format} is not available with {', '.join(text_only)}")
+    if args.batch is None and not args.infiles:
+        parser.error("the following arguments are required: infiles")
+    if args.batch is not None:
+        if len(args.batch) < 2 or args.infiles:
+            parser.error("--batch takes the rule base and at least one instance, and no other input files")
+        if args.export is not None or args.distinct or args.stats:
+            parser.error("--export, --distinct and --stats are not available in batch mode")
+        if args.output_format == "json" and args.output_dir is None:
+            parser.error("--output-format json needs --output-dir in batch mode")
+        if args.output_dir is not None:
+            names = batch_output_names(args.batch[1:], args.output_format)
+            if len(set(names)) < len(names):
+                parser.error("--output-dir: several instances would be written to the same file")
+    return args
+
+_EXTENSIONS = {"text": ".txt", "json": ".json", "ndjson": ".ndjson"}
+
+def batch_output_names(paths, output_format):
+    # The path of each instance relative to the directory that contains all of them, so that instances with the same
+    # name in different directories are not written to the same file
+    paths = [os.path.abspath(path) for path in paths]
+    common = os.path.commonpath([os.path.dirname(path) for path in paths])
+    return [os.path.splitext(os.path.relpath(path, common))[0] + _EXTENSIONS[output_format] for path in paths]
+
+def run_batch(args):
+    from xclingo._batch import explain_batch
+    with open(args.batch[0], "r") as fp:
+        rules = fp.read()
+    # Instances are only opened, one at a time, when they are explained
+    paths = args.batch[1:]
+    if args.output_dir is not None:
+        names = dict(zip(paths, batch_output_names(paths, args.output_format)))
+
+    outputs = explain_batch(
+        rules,
+        paths,
+        jobs=args.jobs,
+        output_format=args.output_format,
+        n_solutions=str(args.n[0]),
+        n_explanations=str(args.n[1]),
+        auto_trace=args.auto_tracing,
+        persistent=args.persistent,
+        cache_dir=args.cache_dir,
+        joint=args.joint,
+        engine=args.engine,
+        memo_size=args.memo,
+    )
+    for path, output in outputs:
+        if args.output_dir is not None:
+            name = os.path.join(args.output_dir, names[path])
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+            with open(name, "w") as fp:
+                fp.write(output)
+        else:
+            if args.output_format == "text":
+                sys.stdout.write(f'Instance {path}\n')
+            sys.stdout.write(output)
+            sys.stdout.flush()
 
 def read_files(files):
     return "\n".join([file.read() for file in files])
 
-def translate(program, auto_trace):
-    explainer = Explainer(auto_trace=auto_trace)
-    explainer.add('base', [], program)
-    explainer._translate_program()
-    translation =  explainer._preprocessor.get_translation()
-    translation += explainer._getExplainerLP(auto_trace=auto_trace)
+def translate(program, auto_trace, joint=False, cache_dir=None):
+    from xclingo import Explainer
+    from xclingo.preprocessor import Preprocessor
+    explainer = Explainer(auto_trace=auto_trace, joint=joint, cache_dir=cache_dir)
+    if cache_dir is not None:
+        # The cached translation is kept as AST statements, without the original rules as comments
+        explainer.add('base', [], program)
+        translation = "".join(f"{statement}\n" for statement in explainer._get_translation())
+    else:
+        preprocessor = Preprocessor()
+        preprocessor.translate_program(program, name='base')
+        translation = preprocessor.get_translation()
+    translation += explainer._getExplainerLP(auto_trace=auto_trace, joint=joint)
     return translation   
 
-def print_explanation_atoms(xControl: XclingoControl):
+def print_explanation_atoms(xControl: "XclingoControl"):
     n = 0
     for xmodel in xControl.get_xclingo_models():
         n += 1
         print(f'Answer {n}')
         print(xmodel)
 
-def print_text_explanations(xControl: XclingoControl):
-    n = 0
-    for answer in xControl.explain():
-        n += 1
-        print(f'Answer {1}')
-        for expl in answer:
-            print(expl.ascii_tree())
+def print_text_explanations(xControl: "XclingoControl", output_format="text"):
+    # Block buffering even on a terminal; the output is flushed after every answer set.
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(line_buffering=False)
+    xControl.write_explanations(sys.stdout, output_format=output_format)
+
+def print_distinct_explanations(xControl: "XclingoControl"):
+    xControl.write_distinct_explanations(sys.stdout)
 
 
 
@@ -62,13 +176,53 @@ def main():
 
     if args.only_translate:
         program = read_files(args.infiles)
-        print(translate(program, args.auto_tracing))
+        print(translate(program, args.auto_tracing, args.joint, args.cache_dir))
         return 0
 
+    if args.batch is not None:
+        run_batch(args)
+        return 0
+
+    if args.connect is not None:
+        # The client does not import clingo nor the explainer
+        from xclingo._client import request_explanations
+        # Without -n, the server uses its own numbers of answer sets and explanations
+        n = [str(value) for value in args.n] if args.n is not None else [None, None]
+        sys.stdout.write(request_explanations(args.connect, read_files(args.infiles), *n))
+        return 0
+
+    if args.serve is not None:
+        from xclingo._server import ExplanationServer
+        server = ExplanationServer(
+            read_files(args.infiles),
+            n_solutions=str(args.n[0]),
+            n_explanations=str(args.n[1]),
+            auto_trace=args.auto_tracing,
+            persistent=args.persistent,
+            cache_dir=args.cache_dir,
+            joint=args.joint,
+            engine=args.engine,
+            memo_size=args.memo,
+        )
+        try:
+            server.serve_forever(args.serve)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    from xclingo import XclingoControl
     xControl = XclingoControl(
         n_solutions=str(args.n[0]),
         n_explanations=str(args.n[1]),
         auto_trace=args.auto_tracing,
+        persistent=args.persistent,
+        cache_dir=args.cache_dir,
+        joint=args.joint,
+        engine=args.engine,
+        workers=args.jobs,
+        ordered=not args.unordered,
+        statistics=args.stats,
+        memo_size=args.memo,
     )
 
     for file in args.infiles:
@@ -78,8 +232,17 @@ def main():
 
     if args.only_explanation_atoms:
         print_explanation_atoms(xControl)
+    elif args.export is not None:
+        xControl.export_explanations(args.export)
+        args.export.close()
+    elif args.distinct:
+        print_distinct_explanations(xControl)
     else:
-        print_text_explanations(xControl)
+        print_text_explanations(xControl, args.output_format)
+
+    if args.stats:
+        # Keeps the JSON output parseable
+        (sys.stdout if args.output_format == "text" else sys.stderr).write(xControl.stats.summary())
 
 if __name__ == '__main__':
     main()
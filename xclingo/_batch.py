@@ -0,0 +1,46 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from xclingo._server import ExplanationServer
+
+
+_worker_server = None
+
+def _init_batch_worker(rules, options):
+    global _worker_server
+    _worker_server = ExplanationServer(rules, **options)
+
+def _explain_instance(server, path, output_format):
+    with open(path, "r") as fp:
+        facts = fp.read()
+    return server.explain(facts, output_format=output_format, fields=dict(instance=path))
+
+def _explain_in_worker(path, output_format):
+    return _explain_instance(_worker_server, path, output_format)
+
+
+def explain_batch(rules, paths, jobs=1, output_format="text", **options):
+    """Explains many instances against the same rule base, which is translated only once by each process (see
+    ExplanationServer). Every instance is explained in its own original and explainer controls.
+
+    Args:
+        rules (str): the annotated rule base.
+        paths (Iterable[str]): the files of the instances.
+        jobs (int, optional): number of processes. Each one keeps the rule base translated and explains whole
+            instances, for as many instances as it is given. Defaults to 1.
+        output_format (str, optional): 'text', 'json' or 'ndjson' (see XclingoControl.write_explanations). The JSON
+            objects have an 'instance' field with the path of the instance. Defaults to 'text'.
+        options: any other argument of XclingoControl (n_solutions, n_explanations, auto_trace...).
+
+    Yields:
+        Tuple[str, str]: the path and the output of every instance, in the order of paths.
+    """
+    if jobs <= 1:
+        server = ExplanationServer(rules, **options)
+        for path in paths:
+            yield path, _explain_instance(server, path, output_format)
+        return
+
+    paths = list(paths)
+    with ProcessPoolExecutor(jobs, initializer=_init_batch_worker, initargs=(rules, options)) as pool:
+        yield from zip(paths, pool.map(_explain_in_worker, paths, repeat(output_format)))
@@ -0,0 +1,63 @@
+"""Client of the explanation server (see xclingo._server). It does not import clingo, so that it starts quickly."""
+import socket
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+
+def parse_address(address):
+    """Parses the address of an explanation server: 'unix:PATH' for a Unix socket, or '[HOST:]PORT' for HTTP over TCP.
+    The host defaults to localhost.
+
+    Returns:
+        Tuple[int, Union[str, Tuple[str, int]]]: the address family and the address, as expected by socket.
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "localhost", int(port))
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost")
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._path)
+
+
+def request_explanations(address, facts, n_solutions=None, n_explanations=None):
+    """Sends the facts to an explanation server and returns its answer.
+
+    Args:
+        address (str): 'unix:PATH' or '[HOST:]PORT' (see parse_address).
+        facts (str): the instance to explain against the rule base of the server.
+        n_solutions (str, optional): number of answer sets. Defaults to the one of the server.
+        n_explanations (str, optional): number of explanations. Defaults to the one of the server.
+
+    Returns:
+        str: the explanations, as written by XclingoControl.write_explanations.
+
+    Raises:
+        RuntimeError: if the server could not explain the facts.
+    """
+    family, server_address = parse_address(address)
+    if family == socket.AF_UNIX:
+        connection = _UnixHTTPConnection(server_address)
+    else:
+        connection = HTTPConnection(*server_address)
+    query = dict()
+    if n_solutions is not None:
+        query["n"] = n_solutions
+    if n_explanations is not None:
+        query["e"] = n_explanations
+    try:
+        connection.request("POST", f"/explain?{urlencode(query)}", body=facts.encode())
+        response = connection.getresponse()
+        text = response.read().decode()
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError(text.strip())
+    return text
@@ -1,15 +1,27 @@
-from typing import Iterable, Sequence
-from clingo import Model, Function, String
-from clingo.ast import ProgramBuilder, parse_string
+import os
+import json
+import threading
+from typing import BinaryIO, Iterable, Sequence, TextIO, Tuple
+from io import StringIO
+from collections import deque, OrderedDict
+from clingo import Model, Function, String, Symbol, TruthValue, parse_term
+from clingo.ast import ProgramBuilder, parse_string, ASTType, Location, Position, Program
 from clingo.control import Control
 from clingo.symbol import SymbolType
-from xclingo.explanation import Explanation
-from xclingo.preprocessor import Preprocessor
+from xclingo.explanation import Explanation, ExplanationTable, ExplanationWriter, CausalGraph
+from xclingo.preprocessor import Preprocessor, TranslationCache
+from xclingo._stats import Stats
 
 from clingo.core import MessageCode
 
+# asyncio and concurrent.futures are only imported by the functions that use them, since importing them takes longer
+# than importing the rest of xclingo
+
 class Context:
     def label(self, text, tup):
+        """Formats a label as @label(Text, (Args,)). The translation no longer calls it, since the labels are
+        formatted when the explanations are printed (see xclingo.explanation._explanation.format_label); it is
+        kept for compatibility with programs and contexts which still use it."""
         if text.type == SymbolType.String:
             text = text.string
         else:
@@ -29,18 +41,120 @@ class Context:
         else:
             return Function('empty', [], True)
 
+_EMPTY_BODY = Function('empty', [], True)
+
+_SOLVED = object()
+
+async def _solve_async(control, on_model, deadline=None, assumptions=(), buffer=1):
+    """Solves a control in clingo's solving thread and yields on_model(model) for every model, without blocking the
+    event loop. Models are only valid inside the callback, so on_model must extract whatever is needed from them. The
+    solving thread waits while buffer results are waiting to be consumed, so a slow consumer also slows the search down.
+
+    Args:
+        control (clingo.Control): the grounded control.
+        on_model (Callable[[clingo.Model], Any]): called, in the solving thread, for every model.
+        deadline (float, optional): time of the event loop clock after which the search is cancelled and
+            asyncio.TimeoutError is raised. Defaults to None.
+        assumptions (Sequence[Tuple[clingo.Symbol, bool]], optional): assumptions of the solve call. Defaults to ().
+        buffer (int, optional): number of results the search may be ahead of the consumer. Defaults to 1.
+    """
+    import asyncio
+    loop = asyncio.get_event_loop()
+    queue = asyncio.Queue()
+    room = threading.Semaphore(buffer)
+    closed = False
+
+    def model_callback(model):
+        room.acquire()
+        if closed:
+            return False
+        loop.call_soon_threadsafe(queue.put_nowait, on_model(model))
+        return True
+
+    def finish_callback(_result):
+        loop.call_soon_threadsafe(queue.put_nowait, _SOLVED)
+
+    handle = control.solve(assumptions=assumptions, on_model=model_callback, on_finish=finish_callback, async_=True)
+    try:
+        while True:
+            if deadline is None:
+                item = await queue.get()
+            else:
+                item = await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0))
+            if item is _SOLVED:
+                break
+            room.release()
+            yield item
+    finally:
+        # The solving thread may be waiting for room: it is let go, and it stops at its next model
+        closed = True
+        room.release()
+        handle.cancel()
+
 class Explainer():
-    def __init__(self, internal_control_arguments=['1'], auto_trace="none"):
+    def __init__(self, internal_control_arguments=['1'], auto_trace="none", persistent=False, cache_dir=None, joint=False, engine="asp", statistics=False, lazy=False, memo_size=0, annotation_warnings=True):
+        if engine not in ("asp", "graph"):
+            raise ValueError(f"unknown explanation engine '{engine}', expected 'asp' or 'graph'")
+        if engine == "graph" and internal_control_arguments[:1] != ['1']:
+            raise ValueError("the graph engine only builds the first explanation of each atom: n_explanations must be 1")
+        self._options = dict(
+            internal_control_arguments=internal_control_arguments,
+            auto_trace=auto_trace,
+            persistent=persistent,
+            cache_dir=cache_dir,
+            joint=joint,
+            engine=engine,
+            statistics=statistics,
+            lazy=lazy,
+            memo_size=memo_size,
+            annotation_warnings=annotation_warnings,
+        )
         self._preprocessor = Preprocessor()
         self._memory = []
         
         self._internal_control_arguments = internal_control_arguments 
         self._auto_trace = auto_trace
+        self._joint = joint
+        # Lazy explanations only create their nodes when they are traversed
+        self._lazy = lazy
         self._translated = False
-        self._current_model = []
+        self._translation = []
+        self._translation_cache = TranslationCache(cache_dir)
+        self._current_model = set()
+
+        self._parts = []
+
+        self._persistent = persistent
+        self._persistent_control = None
+        self._persistent_lock = None
+        self._model_externals = dict()
+
+        self._engine = engine
+        self._graph_program = None
+
+        self._model_signatures = None
+        self._model_wrappers = dict()
+
+        # Explanations of previous models, by the atoms of the model the translation reads
+        self._memo = OrderedDict()
+        self._memo_size = memo_size
+
+        # Phase times are always recorded, clingo statistics only if asked for
+        self.stats = Stats()
+        self._statistics = statistics
+        self._persistent_controls = 0
 
         self._no_labels = False
         self._no_show_trace = False
+        # Whether the malformed annotations are reported, and where the messages of clingo go (printed if None)
+        self._annotation_warnings = annotation_warnings
+        self._messages = None
+
+    def _print(self, text):
+        if self._messages is None:
+            print(text)
+        else:
+            self._messages.append(text)
 
     def logger(self, _code, msg):
         if _code == MessageCode.AtomUndefined:
@@ -48,29 +162,41 @@ class Explainer():
                 return
             if '_xclingo_label_tree/3' in msg:
                 return
+            if '_xclingo_body' in msg:
+                return
             if '_xclingo_label' in msg:
                 self._no_labels = True
                 return
             if '_xclingo_show_trace' in msg:
                 self._no_show_trace = True
-        print(msg)
+        self._print(msg)
 
     def print_messages(self):
         if self._no_labels:
-            print('xclingo info: any atom or rule has been labelled.')
+            self._print('xclingo info: any atom or rule has been labelled.')
         if self._no_show_trace:
-            print('xclingo info: any atom has been affected by a %!show_trace annotation.')
+            self._print('xclingo info: any atom has been affected by a %!show_trace annotation.')
     
     def clean_log(self):
         self._no_labels = False
         self._no_show_trace = False
 
-    def _getExplainerLP(self, auto_trace="none"):
+    _explainer_ast = dict()
+
+    def _getExplainerAST(self, auto_trace="none", joint=False):
+        """Returns the explainer program as a list of AST statements. It is parsed only once per process."""
+        if (auto_trace, joint) not in Explainer._explainer_ast:
+            statements = []
+            parse_string(self._loadExplainerLP(auto_trace, joint), statements.append)
+            Explainer._explainer_ast[(auto_trace, joint)] = statements
+        return Explainer._explainer_ast[(auto_trace, joint)]
+
+    def _getExplainerLP(self, auto_trace="none", joint=False):
         if hasattr(self, '_explainerLP') == False:
-            setattr(self, '_explainerLP', self._loadExplainerLP(auto_trace))
+            setattr(self, '_explainerLP', self._loadExplainerLP(auto_trace, joint))
         return self._explainerLP
 
-    def _loadExplainerLP(self, auto_trace="none"):
+    def _loadExplainerLP(self, auto_trace="none", joint=False):
         try:
             import importlib.resources as pkg_resources
         except ImportError:
@@ -79,6 +205,7 @@ class Explainer():
 
         from . import xclingo_lp  # relative-import the *package* containing the templates
         program = pkg_resources.read_text(xclingo_lp, 'xclingo.lp')
+        program += pkg_resources.read_text(xclingo_lp, 'explain_all.lp' if joint else 'explain_one.lp')
         if auto_trace == "all":
             program += pkg_resources.read_text(xclingo_lp, 'autotrace_all.lp')
         elif auto_trace == "facts":
@@ -86,88 +213,636 @@ class Explainer():
         return program
 
     def add(self, program_name:str, parameters: Iterable[str], program:str):
-        self._memory.append((program_name, program))
+        self._memory.append((program_name, list(parameters), program))
+        self._translated = False
+        self._reset_persistent_control()
+        self._memo.clear()
+
+    def ground(self, parts:Sequence[Tuple[str, Sequence[Symbol]]]=(("base", ()),)):
+        """Adds program parts to the ones grounded by the explainer, as they are grounded in the original program.
+        The base part is always grounded.
+
+        Args:
+            parts (Sequence[Tuple[str, Sequence[clingo.Symbol]]], optional): the parts, as in clingo.Control.ground.
+                Defaults to (("base", ()),).
+        """
+        for name, arguments in parts:
+            part = (name, tuple(arguments))
+            if part not in self._parts:
+                self._parts.append(part)
+        self._reset_persistent_control()
+        self._memo.clear()
+
+    def _get_parts(self):
+        base = ("base", ())
+        return [base] + [part for part in self._parts if part != base]
+
+    def _reset_persistent_control(self):
+        self._persistent_control = None
+        self._model_externals = dict()
+        self._current_model = set()
 
     def _initialize_control(self):
         return Control(
             self._internal_control_arguments + \
                 [
                     '--project=project'
-                ], 
+                ] + (['--stats'] if self._statistics else []), 
             logger=self.logger)
 
+    # The preprocessors of the last translations, to translate programs added on top of them (see _resume_translation)
+    _preprocessors = OrderedDict()
+    preprocessors_size = 8
+
+    # The preprocessors of rule bases kept for as long as the process lives (see _pin_translation)
+    _pinned_preprocessors = dict()
+
+    def _resume_translation(self):
+        """Returns a preprocessor which has already translated the longest possible prefix of the added programs, and
+        the length of that prefix. Translating a rule base once and then, many times, the same rule base plus
+        different instances only translates the instances."""
+        for n in range(len(self._memory) - 1, 0, -1):
+            key = TranslationCache.key(self._memory[:n], self._auto_trace)
+            preprocessor = Explainer._pinned_preprocessors.get(key, None)
+            if preprocessor is None:
+                preprocessor = Explainer._preprocessors.get(key, None)
+                if preprocessor is not None:
+                    Explainer._preprocessors.move_to_end(key)
+            if preprocessor is not None:
+                return preprocessor.copy(), n
+        return Preprocessor(), 0
+
+    def _pin_translation(self):
+        """Keeps the preprocessor of the added programs for as long as the process lives, so that the programs added
+        on top of them are the only ones translated, however many other translations are made in between."""
+        key = TranslationCache.key(self._memory, self._auto_trace)
+        if key in Explainer._pinned_preprocessors:
+            return
+        preprocessor = Explainer._preprocessors.get(key, None)
+        if preprocessor is None:
+            # The translation was cached, but not the preprocessor that made it
+            with self.stats.phase("translate"):
+                preprocessor = Preprocessor()
+                for name, parameters, program in self._memory:
+                    preprocessor.translate_program(program, name=name, parameters=parameters)
+        Explainer._pinned_preprocessors[key] = preprocessor
+
+    def _remember_preprocessor(self, key, preprocessor):
+        Explainer._preprocessors[key] = preprocessor
+        Explainer._preprocessors.move_to_end(key)
+        while len(Explainer._preprocessors) > Explainer.preprocessors_size:
+            Explainer._preprocessors.popitem(last=False)
+
+    def _warn_malformed_annotations(self, diagnostics):
+        if not self._annotation_warnings:
+            return
+        for name, line, column, text in diagnostics:
+            print(f'xclingo warning: unrecognised annotation at {name}:{line}:{column}: {text}')
+
     def _translate_program(self):
-        self._preprocessor._rule_count = 1
-        for name, program in self._memory:
-            self._preprocessor.translate_program(program, name=name)
+        """Translates the added programs, unless the same programs have already been translated before (by this or
+        any other explainer, or by a previous process sharing the cache directory)."""
+        key = TranslationCache.key(self._memory, self._auto_trace)
+        entry = self._translation_cache.get_entry(key)
+        if entry is None:
+            with self.stats.phase("translate"):
+                self._preprocessor, translated = self._resume_translation()
+                reported = len(self._preprocessor.malformed_annotations)
+                for name, parameters, program in self._memory[translated:]:
+                    self._preprocessor.translate_program(program, name=name, parameters=parameters)
+                translation = self._preprocessor.get_translation_ast()
+                self._remember_preprocessor(key, self._preprocessor)
+            diagnostics = [(name, a.line, a.column, a.text) for name, a in self._preprocessor.malformed_annotations]
+            self._warn_malformed_annotations(diagnostics[reported:])
+            self._translation_cache.set(key, translation, diagnostics)
+        else:
+            # The diagnostics are kept with the cached translation, so the annotations are not scanned again
+            translation, diagnostics = entry
+            self._warn_malformed_annotations(diagnostics)
+        self._translation = translation
+        self._translated = True
+
+    def _get_translation(self):
+        if not self._translated:
+            self._translate_program()
+        return self._translation
+
+    def _add_explainer_program(self, control):
+        translation = self._get_translation()
+        with self.stats.phase("parse"), ProgramBuilder(control) as builder:
+            for statement in self._getExplainerAST(auto_trace=self._auto_trace, joint=self._joint):
+                builder.add(statement)
+            for statement in translation:
+                builder.add(statement)
 
-    def _ground(self, control, model, context=None):
+    def _get_model_signatures(self):
+        """Returns the signatures of the atoms that the translation reads through _xclingo_model/1, or None if it may
+        read any atom."""
+        translation = self._get_translation()
+        if self._model_signatures is None or self._model_signatures[0] is not translation:
+            self._model_signatures = (translation, Preprocessor.model_signatures(translation))
+            self._model_wrappers = dict()
+        return self._model_signatures[1]
+
+    def _model_facts(self, symbols):
+        """Yields the atoms of a model that the translation may use, each one with its _xclingo_model/1 atom. The
+        _xclingo_model/1 atoms (and which atoms are not used) are kept between models."""
+        signatures = self._get_model_signatures()
+        wrappers = self._model_wrappers
+        for sym in symbols:
+            wrapper = wrappers.get(sym, None)
+            if wrapper is None:
+                if signatures is None or (sym.name, len(sym.arguments)) in signatures:
+                    wrapper = Function('_xclingo_model', [sym], True)
+                else:
+                    wrapper = False
+                wrappers[sym] = wrapper
+            if wrapper is not False:
+                yield sym, wrapper
+
+    def _add_model_facts(self, control, symbols):
+        self._get_model_signatures()
+        with self.stats.phase("inject"), control.backend() as backend:
+            add_atom, add_rule = backend.add_atom, backend.add_rule
+            for _, wrapper in self._model_facts(symbols):
+                add_rule([add_atom(wrapper)])
+
+    def _ground(self, control, symbols, context=None):
         """Grounding for the explainer clingo control. It translates the program and adds the original program's model as facts.
 
         Args:
             control (_type_): _description_
-            model (_type_): _description_
+            symbols (Iterable[clingo.Symbol]): the atoms of the original program's model.
             context (_type_, optional): _description_. Defaults to None.
         """
-        if not self._translated:
-            self._translate_program()
-            self._translated
-            
-        with ProgramBuilder(control) as builder:
-            parse_string(
-                self._getExplainerLP(auto_trace=self._auto_trace)+self._preprocessor.get_translation(),
-                lambda ast: builder.add(ast),
+        self._add_explainer_program(control)
+        self._add_model_facts(control, symbols)
+
+        with self.stats.phase("ground"):
+            control.ground(self._get_parts(), context=context if context is not None else Context())
+
+    def _ground_persistent(self, control, domain, context=None):
+        """Grounding for the persistent explainer clingo control. Every atom of the domain is added as an external
+        _xclingo_model/1 atom, so the same ground program can be reused for any model of the original program.
+
+        Args:
+            control (clingo.Control): the explainer control.
+            domain (Iterable[clingo.Symbol]): the ground atoms of the original program.
+            context (_type_, optional): context passed to the grounder. Defaults to None.
+        """
+        self._add_explainer_program(control)
+
+        self._get_model_signatures()
+        with self.stats.phase("inject"), control.backend() as backend:
+            for sym, wrapper in self._model_facts(domain):
+                atm_id = backend.add_atom(wrapper)
+                backend.add_external(atm_id, TruthValue.False_)
+                self._model_externals[sym] = atm_id
+
+        with self.stats.phase("ground"):
+            control.ground(self._get_parts(), context=context if context is not None else Context())
+
+    def _get_persistent_control(self, domain, context=None):
+        if self._persistent_control is None:
+            if domain is None:
+                raise ValueError("the persistent explainer needs the domain of the original program to ground")
+            control = self._initialize_control()
+            self.clean_log()
+            self._ground_persistent(control, domain, context)
+            self.print_messages()
+            self._persistent_control = control
+            self._persistent_controls += 1
+        return self._persistent_control
+
+    def _assign_model(self, control, symbols):
+        """Sets the _xclingo_model/1 externals of the persistent control to the atoms of the given model. Only the
+        externals which differ from the previous model are reassigned."""
+        self._get_model_signatures()
+        with self.stats.phase("inject"):
+            current = {sym for sym, _ in self._model_facts(symbols)}
+            for sym in self._current_model - current:
+                control.assign_external(self._model_externals[sym], False)
+            for sym in current - self._current_model:
+                control.assign_external(self._model_externals[sym], True)
+            self._current_model = current
+
+    def _get_graph_program(self):
+        """Splits the translation into the rules needed to build the support graph and the label rules, which are
+        grounded once the supports have been chosen. The label rules of each part name(params) go to the part
+        _xclingo_labels_name(params). The _xclingo_fbody/3 rules are not needed by the graph engine."""
+        translation = self._get_translation()
+        if self._graph_program is None or self._graph_program[0] is not translation:
+            loc = Location(Position("", 0, 0), Position("", 0, 0))
+            supports, labels = [], [Program(loc, "_xclingo_labels_base", [])]
+            for statement in translation:
+                if statement.ast_type == ASTType.Program:
+                    supports.append(statement)
+                    labels.append(statement.update(name=f"_xclingo_labels_{statement.name}"))
+                    continue
+                if statement.ast_type != ASTType.Rule:
+                    continue
+                name = statement.head.atom.symbol.name
+                if name == '_xclingo_label':
+                    labels.append(statement)
+                elif name != '_xclingo_fbody':
+                    supports.append(statement)
+            self._graph_program = (translation, supports, labels)
+        return self._graph_program[1], self._graph_program[2]
+
+    def _graph_explanations(self, symbols, context=None):
+        """Builds the first explanation of every shown atom without solving. The supports are grounded and walked
+        in Python (see CausalGraph), then only the labels of the atoms in the explanations are grounded."""
+        control = self._initialize_control()
+        context = context if context is not None else Context()
+        supports, labels = self._get_graph_program()
+        with self.stats.phase("parse"), ProgramBuilder(control) as builder:
+            for statement in supports:
+                builder.add(statement)
+            for statement in labels:
+                builder.add(statement)
+        self._add_model_facts(control, symbols)
+        parts = self._get_parts()
+        with self.stats.phase("ground"):
+            control.ground(parts, context=context)
+
+        atoms = control.symbolic_atoms
+        with self.stats.phase("solve"):
+            bodies = dict()
+            for sa in atoms.by_signature('_xclingo_body', 4):
+                rule_id, body, position, atom = sa.symbol.arguments
+                bodies.setdefault((rule_id, body), []).append((position, atom))
+            graph = CausalGraph(
+                (tuple(sa.symbol.arguments) for sa in atoms.by_signature('_xclingo_sup', 3)),
+                {key: [atom for _, atom in sorted(entries)] for key, entries in bodies.items()},
+                muted=(sa.symbol.arguments[0] for sa in atoms.by_signature('_xclingo_muted', 1)),
             )
-        
-        with control.backend() as backend:
-            for sym in model.symbols(atoms=True):
-                atm_id = backend.add_atom(Function('_xclingo_model', [sym], True))
-                backend.add_rule([atm_id], [], False)
-            
-        control.ground([('base', [])], context=context if context is not None else Context())
+            roots = sorted(sa.symbol.arguments[0] for sa in atoms.by_signature('_xclingo_show_trace', 1))
+            tree = graph.tree_atoms(roots)
 
+        with self.stats.phase("inject"), control.backend() as backend:
+            for atom, (rule_id, body) in tree.items():
+                backend.add_rule([backend.add_atom(Function('_xclingo_f', [rule_id, atom, body], True))])
+                backend.add_rule([backend.add_atom(Function('_xclingo_intree', [atom], True))])
+        with self.stats.phase("ground"):
+            control.ground([(f"_xclingo_labels_{name}", arguments) for name, arguments in parts], context=context)
 
-    def _get_explanations(self, control):
-        with control.solve(yield_=True) as it:
-            for expl_model in it:
-                syms = expl_model.symbols(shown=True)  # shown is True because we want to get only the summarized graph
-                if len(syms)>0:
-                    yield Explanation.from_model(syms)
+        with self.stats.phase("solve"):
+            atom_labels = dict()
+            for sa in atoms.by_signature('_xclingo_label', 2):
+                atom_labels.setdefault(sa.symbol.arguments[0], []).append(sa.symbol.arguments[1])
+            if self._auto_trace != "none":
+                for atom, (_, body) in tree.items():
+                    if self._auto_trace == "all" or body == _EMPTY_BODY:
+                        atom_labels.setdefault(atom, []).append(atom)
+            explanations = graph.explanations(roots, atom_labels)
+
+        if self._statistics:
+            self.stats.add_explainer_statistics(control.statistics)
+        return explanations
+
+    def _solve_explanations(self, control, build, assumptions=()):
+        """Yields the explanations built by build(symbols) from every model of the explainer."""
+        with control.solve(yield_=True, assumptions=assumptions) as handle:
+            # A SolveHandle is iterable, but not an iterator
+            it = iter(handle)
+            while True:
+                # The solve phase excludes the time spent by the caller between explanations
+                with self.stats.phase("solve"):
+                    expl_model = next(it, None)
+                    if expl_model is None:
+                        break
+                    syms = expl_model.symbols(shown=True)  # shown is True because we want to get only the summarized graph
+                    if len(syms) == 0:
+                        continue
+                    explanations = build(syms)
+                yield from explanations
+
+    def _get_explanations(self, control, key=None):
+        if self._joint:
+            yield from self._get_joint_explanations(control)
+        else:
+            yield from self._solve_explanations(control, lambda syms: [Explanation.from_model(syms, lazy=self._lazy)])
+        if self._statistics:
+            self.stats.add_explainer_statistics(control.statistics, key)
+
+    @staticmethod
+    def _joint_assumptions(control, atom=None):
+        """Leaves out of a joint explanation every atom but the given one, or none if no atom is given."""
+        return [
+            (sa.symbol, atom is not None and sa.symbol.arguments[0] != atom)
+            for sa in control.symbolic_atoms.by_signature('_xclingo_skip_explain', 1)
+        ]
+
+    def _joint_atoms(self, syms):
+        """The atoms explained by the first model of a joint explainer, whose explanations are then enumerated one
+        atom at a time. None if a single explanation is asked for, since that model already holds it."""
+        if self._internal_control_arguments[:1] == ['1']:
+            return None
+        return sorted({s.arguments[0].arguments[0] for s in syms if Explanation._is_root(s.arguments[0])})
+
+    def _get_joint_explanations(self, control):
+        """Explains every shown atom in a single solve. If more than one explanation is asked for, the explanations
+        of each atom are then enumerated by solving again with the other atoms left out, instead of enumerating
+        every combination of the explanations of all the atoms."""
+        with self.stats.phase("solve"):
+            with control.solve(yield_=True, assumptions=self._joint_assumptions(control)) as handle:
+                expl_model = next(iter(handle), None)
+                syms = expl_model.symbols(shown=True) if expl_model is not None else []
+        if len(syms) == 0:
+            return
+        atoms = self._joint_atoms(syms)
+        if atoms is None:
+            with self.stats.phase("solve"):
+                explanations = Explanation.from_joint_model(syms, lazy=self._lazy)
+            yield from explanations
+            return
+
+        for atom in atoms:
+            yield from self._solve_explanations(
+                control,
+                lambda syms: Explanation.from_joint_model(syms, lazy=self._lazy),
+                self._joint_assumptions(control, atom),
+            )
     
+    def _get_persistent_explanations(self, control, symbols):
+        # The persistent control holds one model at a time: it is assigned when the explanations are consumed, not
+        # when they are asked for
+        self._assign_model(control, symbols)
+        yield from self._get_explanations(control, key=self._persistent_controls)
+
     def _get_models(self, control):
-        with control.solve(yield_=True) as it:
+        assumptions = self._joint_assumptions(control) if self._joint else []
+        with control.solve(yield_=True, assumptions=assumptions) as it:
             for expl_model in it:
                 yield expl_model
 
+    def _get_persistent_models(self, control, symbols):
+        self._assign_model(control, symbols)
+        yield from self._get_models(control)
+
+    @staticmethod
+    def _model_domain(model):
+        return (sa.symbol for sa in model.context.symbolic_atoms)
+
     def get_xclingo_models(self, model:Model) -> Iterable[Explanation]:
+        symbols = model.symbols(atoms=True)
+        if self._persistent:
+            control = self._get_persistent_control(self._model_domain(model))
+            return self._get_persistent_models(control, symbols)
         control = self._initialize_control()
         self.clean_log()
-        self._ground(control, model)
+        self._ground(control, symbols)
         self.print_messages()
         return self._get_models(control)
 
     def explain(self, model:Model, context=None) -> Iterable[Explanation]:
+        return self.explain_symbols(model.symbols(atoms=True), context, domain=self._model_domain(model))
+
+    def explain_symbols(self, symbols:Iterable[Symbol], context=None, domain:Iterable[Symbol]=None) -> Iterable[Explanation]:
+        """Explains a model of the original program given by its atoms.
+
+        Args:
+            symbols (Iterable[clingo.Symbol]): the atoms of the model.
+            context (Object, optional): context passed to the explainer grounder. Defaults to None.
+            domain (Iterable[clingo.Symbol], optional): every atom the original program may contain. Required by
+                the persistent mode the first time it grounds, which raises ValueError without it. Defaults to None.
+
+        Returns:
+            Iterable[Explanation]: the explanations of the model. If the explainer keeps a memo (memo_size > 0), they
+                are all computed before returning, and they may be the same objects returned for a previous model.
+        """
+        self.stats.models += 1
+        if self._memo_size <= 0:
+            return self._explain_symbols(symbols, context, domain)
+
+        symbols = list(symbols)
+        key = self._memo_key(symbols)
+        explanations = self._memo_get(key)
+        if explanations is None:
+            explanations = list(self._explain_symbols(symbols, context, domain))
+            self._memo_set(key, explanations)
+        return iter(explanations)
+
+    def _memo_key(self, symbols):
+        # The translation only reads the atoms of the model in the backward cone of the traced atoms, so models which
+        # agree on those atoms have the same explanations
+        with self.stats.phase("inject"):
+            return frozenset(sym for sym, _ in self._model_facts(symbols))
+
+    def _memo_get(self, key):
+        explanations = self._memo.get(key, None)
+        if explanations is not None:
+            self._memo.move_to_end(key)
+            self.stats.reused += 1
+        return explanations
+
+    def _memo_set(self, key, explanations):
+        self._memo[key] = explanations
+        while len(self._memo) > self._memo_size:
+            self._memo.popitem(last=False)
+
+    def _explain_symbols(self, symbols, context, domain):
+        if self._engine == "graph":
+            self.clean_log()
+            explanations = self._graph_explanations(symbols, context)
+            self.print_messages()
+            return iter(explanations)
+        if self._persistent:
+            control = self._get_persistent_control(domain, context)
+            return self._get_persistent_explanations(control, list(symbols))
         control = self._initialize_control()    
         self.clean_log()
-        self._ground(control, model, context)
+        self._ground(control, symbols, context)
         self.print_messages()
         return self._get_explanations(control)
 
+    async def _solve_explanations_async(self, control, build, deadline=None, assumptions=()):
+        models = _solve_async(control, lambda m: m.symbols(shown=True), deadline, assumptions)
+        try:
+            async for syms in models:
+                if len(syms) == 0:
+                    continue
+                with self.stats.phase("solve"):
+                    explanations = build(syms)
+                for explanation in explanations:
+                    yield explanation
+        finally:
+            await models.aclose()
+
+    async def _get_joint_explanations_async(self, control, deadline=None):
+        """Asynchronous counterpart of _get_joint_explanations."""
+        models = _solve_async(control, lambda m: m.symbols(shown=True), deadline, self._joint_assumptions(control))
+        try:
+            syms = await models.__anext__()
+        except StopAsyncIteration:
+            return
+        finally:
+            await models.aclose()
+        if len(syms) == 0:
+            return
+        atoms = self._joint_atoms(syms)
+        if atoms is None:
+            with self.stats.phase("solve"):
+                explanations = Explanation.from_joint_model(syms, lazy=self._lazy)
+            for explanation in explanations:
+                yield explanation
+            return
+
+        for atom in atoms:
+            solved = self._solve_explanations_async(
+                control,
+                lambda syms: Explanation.from_joint_model(syms, lazy=self._lazy),
+                deadline,
+                self._joint_assumptions(control, atom),
+            )
+            try:
+                async for explanation in solved:
+                    yield explanation
+            finally:
+                await solved.aclose()
+
+    async def _get_explanations_async(self, control, key=None, deadline=None):
+        if self._joint:
+            explanations = self._get_joint_explanations_async(control, deadline)
+        else:
+            explanations = self._solve_explanations_async(
+                control, lambda syms: [Explanation.from_model(syms, lazy=self._lazy)], deadline
+            )
+        try:
+            async for explanation in explanations:
+                yield explanation
+        finally:
+            await explanations.aclose()
+        if self._statistics:
+            self.stats.add_explainer_statistics(control.statistics, key)
+
+    async def explain_symbols_async(self, symbols:Iterable[Symbol], context=None, domain:Iterable[Symbol]=None, deadline:float=None):
+        """Asynchronous counterpart of explain_symbols. The explainer is solved in clingo's own solving thread, so the
+        event loop is not blocked while searching for explanations (translating and grounding still run in the
+        calling thread). Closing the iterator, or cancelling the task consuming it, stops the search.
+
+        Args:
+            symbols (Iterable[clingo.Symbol]): the atoms of the model.
+            context (Object, optional): context passed to the explainer grounder. Defaults to None.
+            domain (Iterable[clingo.Symbol], optional): every atom the original program may contain. Required by
+                the persistent mode the first time it grounds, which raises ValueError without it. Defaults to None.
+            deadline (float, optional): time of the event loop clock (see asyncio.AbstractEventLoop.time) after which
+                asyncio.TimeoutError is raised. Defaults to None.
+
+        Yields:
+            Explanation: the explanations of the model.
+        """
+        self.stats.models += 1
+        key = None
+        if self._memo_size > 0:
+            symbols = list(symbols)
+            key = self._memo_key(symbols)
+            explanations = self._memo_get(key)
+            if explanations is not None:
+                for explanation in explanations:
+                    yield explanation
+                return
+
+        explanations = []
+        if self._engine == "graph":
+            self.clean_log()
+            explanations = self._graph_explanations(symbols, context)
+            self.print_messages()
+            for explanation in explanations:
+                yield explanation
+        elif self._persistent:
+            # The persistent control holds one model at a time
+            if self._persistent_lock is None:
+                import asyncio
+                self._persistent_lock = asyncio.Lock()
+            async with self._persistent_lock:
+                control = self._get_persistent_control(domain, context)
+                self._assign_model(control, symbols)
+                solved = self._get_explanations_async(control, self._persistent_controls, deadline)
+                try:
+                    async for explanation in solved:
+                        explanations.append(explanation)
+                        yield explanation
+                finally:
+                    await solved.aclose()
+        else:
+            control = self._initialize_control()
+            self.clean_log()
+            self._ground(control, symbols, context)
+            self.print_messages()
+            solved = self._get_explanations_async(control, deadline=deadline)
+            try:
+                async for explanation in solved:
+                    explanations.append(explanation)
+                    yield explanation
+            finally:
+                await solved.aclose()
+
+        # Only complete results are kept: an interrupted search never reaches this point
+        if key is not None:
+            self._memo_set(key, explanations)
+
+
+_worker_explainer = None
+_worker_context = None
+_worker_domain = None
+
+def _init_explainer_worker(options, programs, parts, context, domain):
+    global _worker_explainer, _worker_context, _worker_domain
+    # The parent process has already reported the malformed annotations, and it prints the messages of clingo
+    # (see XclingoControl._next_result)
+    _worker_explainer = Explainer(**dict(options, annotation_warnings=False))
+    _worker_explainer._messages = []
+    for name, parameters, program in programs:
+        _worker_explainer.add(name, parameters, program)
+    _worker_explainer.ground([(name, [parse_term(a) for a in arguments]) for name, arguments in parts])
+    _worker_explainer._get_translation()
+    _worker_context = context
+    _worker_domain = [parse_term(atom) for atom in domain] if domain is not None else None
+
+def _explain_in_worker(atoms):
+    # clingo symbols can not be sent between processes, so the atoms travel as text
+    symbols = [parse_term(atom) for atom in atoms]
+    _worker_explainer.stats = Stats()
+    explanations = list(_worker_explainer.explain_symbols(symbols, _worker_context, domain=_worker_domain))
+    messages, _worker_explainer._messages = _worker_explainer._messages, []
+    return os.getpid(), explanations, _worker_explainer.stats, messages
+
 
 class XclingoControl:
-    def __init__(self, n_solutions='1', n_explanations='1', auto_trace='none'):
+    def __init__(self, n_solutions='1', n_explanations='1', auto_trace='none', persistent=False, cache_dir=None, joint=False, engine='asp', workers=1, statistics=False, lazy=False, memo_size=0, ordered=True):
         self.n_solutions = n_solutions
         self.n_explanations = n_explanations
+        self.workers = workers
+        # With several workers, whether the answer sets keep their order or are returned as they are explained
+        self.ordered = ordered
+        self.statistics = statistics
 
-        self.control = Control([n_solutions if type(n_solutions)==str else str(n_solutions)])
+        self.control = Control(
+            [n_solutions if type(n_solutions)==str else str(n_solutions)] + (['--stats'] if statistics else [])
+        )
         self.explainer = Explainer(
             [
                 n_explanations if type(n_explanations)==str else str(n_explanations), 
             ], 
-            auto_trace=auto_trace
+            auto_trace=auto_trace,
+            persistent=persistent,
+            cache_dir=cache_dir,
+            joint=joint,
+            engine=engine,
+            statistics=statistics,
+            lazy=lazy,
+            memo_size=memo_size,
         )
 
         self._explainer_context = None
+        self._printed_messages = set()
+
+    @property
+    def stats(self):
+        """Stats: the time spent in each phase of the explanations so far and, if the control was created with
+        statistics=True, the clingo statistics of the original and the explainer controls."""
+        return self.explainer.stats
 
     def add(self, name, parameters, program):
         """It adds a program to the control.
@@ -177,16 +852,21 @@ class XclingoControl:
             parameters (Iterable[str]): a list (or iterable) of for the program.
             program (str): a logic program in ASP format.
         """
-        self.control.add("base", parameters, program)
-        self.explainer.add(name, [], program)
+        self.control.add(name, parameters, program)
+        self.explainer.add(name, parameters, program)
         
-    def ground(self, context=None):
-        """Ground (only base for now) programs.
+    def ground(self, context=None, parts=(("base", ()),)):
+        """Grounds the given program parts. It can be called several times (multi-shot solving): every call only
+        grounds the new parts in the original program control, and the explanations of later models take all the
+        parts grounded so far into account.
 
         Args:
             context (Object, optional): Context to be passed to the original program control. Defaults to None.
+            parts (Sequence[Tuple[str, Sequence[clingo.Symbol]]], optional): the parts to ground, as in
+                clingo.Control.ground. Defaults to (("base", ()),).
         """
-        self.control.ground([("base", [])], context)
+        self.control.ground(parts, context)
+        self.explainer.ground(parts)
 
     def get_xclingo_models(self):
         """Returns the clingo.Model objects of the explainer, this is the models which represent the explanations.
@@ -207,19 +887,212 @@ class XclingoControl:
         Yields:
             Explation: a tree-like object that represents an explanation.
         """
+        if self.workers > 1:
+            for explanations in self._explain_parallel(self.ordered):
+                if on_explanation is None:
+                    yield explanations
+                else:
+                    on_explanation(explanations)
+            self._record_statistics()
+            return
+
         with self.control.solve(yield_=True) as it:
             for m in it:
                 if on_explanation is None:
                     yield self.explainer.explain(m, context=self._explainer_context)
                 else:
                     on_explanation(self.explainer.explain(m, context=self._explainer_context))
+        self._record_statistics()
 
-    def _default_output(self):
-        output = ''
+    async def explain_async(self, timeout=None):
+        """Asynchronous counterpart of explain. The original program and the explainers are solved in clingo's own
+        solving threads, so that several explanation requests can be served concurrently by a single event loop.
+        Cancelling the task consuming the iterator stops every search in progress.
+
+        Args:
+            timeout (float, optional): seconds after which the search is cancelled and asyncio.TimeoutError is
+                raised. Defaults to None.
+
+        Yields:
+            List[Explanation]: the explanations of each answer set.
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        domain = None
+        if self.explainer._persistent:
+            domain = [sa.symbol for sa in self.control.symbolic_atoms]
+
+        models = _solve_async(self.control, lambda m: m.symbols(atoms=True), deadline)
+        try:
+            async for symbols in models:
+                explanations = []
+                async for explanation in self.explainer.explain_symbols_async(
+                    symbols, context=self._explainer_context, domain=domain, deadline=deadline
+                ):
+                    explanations.append(explanation)
+                yield explanations
+        finally:
+            # Cancelling the task only interrupts the innermost search: the search of the original program is
+            # waiting for the next model, and it is only stopped when its generator is closed
+            await models.aclose()
+        self._record_statistics()
+
+    def _record_statistics(self):
+        if self.statistics:
+            self.explainer.stats.original = self.control.statistics
+
+    def _explain_parallel(self, ordered=True):
+        """Explains the answer sets in a pool of worker processes, each one holding its own explainer. The atoms of
+        every model are sent to the pool as soon as the model is found.
+
+        Args:
+            ordered (bool, optional): if True, the results are yielded in the order of the answer sets. Otherwise they
+                are yielded as they are finished. Defaults to True.
+
+        Yields:
+            List[Explanation]: the explanations of each answer set.
+        """
+        # Translating before the pool is started lets forked workers find it in the translation cache
+        self.explainer._get_translation()
+        domain = None
+        if self.explainer._persistent:
+            domain = [str(sa.symbol) for sa in self.control.symbolic_atoms]
+
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(
+            self.workers,
+            initializer=_init_explainer_worker,
+            initargs=(
+                self.explainer._options,
+                self.explainer._memory,
+                [(name, [str(a) for a in arguments]) for name, arguments in self.explainer._parts],
+                self._explainer_context,
+                domain,
+            ),
+        ) as pool:
+            pending = deque()
+            with self.control.solve(yield_=True) as it:
+                for m in it:
+                    pending.append(pool.submit(_explain_in_worker, [str(s) for s in m.symbols(atoms=True)]))
+                    while len(pending) >= 2 * self.workers:
+                        yield self._next_result(pending, ordered)
+            while pending:
+                yield self._next_result(pending, ordered)
+
+    def _next_result(self, pending, ordered):
+        if ordered:
+            future = pending.popleft()
+        else:
+            from concurrent.futures import wait, FIRST_COMPLETED
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            future = done.pop()
+            pending.remove(future)
+        pid, explanations, stats, messages = future.result()
+        self.explainer.stats.merge(stats, key=pid)
+        for message in messages:
+            # Every worker grounds its own persistent explainer, whose messages are printed only once
+            if self.explainer._persistent:
+                if message in self._printed_messages:
+                    continue
+                self._printed_messages.add(message)
+            print(message)
+        return explanations
+
+    def write_explanations(self, out: TextIO, flush=True, output_format="text", fields=None):
+        """Writes the explanations of every answer set to a file-like object as they are computed. Each explanation
+        is written node by node, so the text of a whole answer set is never held in memory.
+
+        Args:
+            out (TextIO): file-like object where the explanations are written.
+            flush (bool, optional): if True, out is flushed after each answer set. Defaults to True.
+            output_format (str, optional): 'text' for ascii trees, 'ndjson' for one JSON object per line and
+                explanation, or 'json' for a JSON array of those objects. Every object has the number of the answer
+                set, the number of the explanation within it, and the nodes and edges of the explanation (see
+                Explanation.to_dict). An answer set without explanations is written as a single object with the
+                number of the answer set and 'explanations': 0. Defaults to 'text'.
+            fields (dict, optional): other fields added to every JSON object. Defaults to None.
+        """
+        if output_format not in ("text", "json", "ndjson"):
+            raise ValueError(f"unknown output format '{output_format}', expected 'text', 'json' or 'ndjson'")
         n = 0
+        separator = "[\n"
+
+        def write_record(write):
+            nonlocal separator
+            if output_format == "json":
+                out.write(separator)
+                separator = ",\n"
+            write()
+            if output_format == "ndjson":
+                out.write('\n')
+
         for answer in self.explain():
-            n = 1
-            output += f'Answer {n}\n'
-            output += '\n'.join([expl.ascii_tree() for expl in answer])
-            output += '\n'
-        return output
\ No newline at end of file
+            n += 1
+            if output_format == "text":
+                out.write(f'Answer {n}\n')
+                empty = True
+                for expl in answer:
+                    expl.write_ascii_tree(out)
+                    out.write('\n')
+                    empty = False
+                if empty:
+                    # An answer set without explanations is still followed by a blank line
+                    out.write('\n')
+            else:
+                k = 0
+                for k, expl in enumerate(answer, 1):
+                    write_record(lambda: expl.write_json(out, **(fields or dict()), answer=n, explanation=k))
+                if k == 0:
+                    # An answer set without explanations is still reported, so it is not taken for a missing one
+                    write_record(lambda: json.dump(dict(fields or dict(), answer=n, explanations=0), out))
+            if flush:
+                out.flush()
+        if output_format == "json":
+            out.write("[]\n" if separator == "[\n" else "\n]\n")
+
+    def export_explanations(self, fp: BinaryIO):
+        """Writes the explanations of every answer set, as they are computed, to a compact binary file which can be
+        read back with xclingo.explanation.ExplanationReader.
+
+        Args:
+            fp (BinaryIO): file opened for writing in binary mode.
+        """
+        with ExplanationWriter(fp) as writer:
+            for answer in self.explain():
+                writer.write_answer(answer)
+
+    def explain_distinct(self):
+        """Explains every answer set and groups the explanations which are structurally equal. Identical subtrees
+        are shared in memory (see xclingo.explanation.ExplanationTable).
+
+        Returns:
+            List[Tuple[Explanation, List[int]]]: every distinct explanation, in the order they were found, with the
+                numbers of the answer sets it belongs to.
+        """
+        table = ExplanationTable()
+        groups = dict()
+        for n, answer in enumerate(self.explain(), 1):
+            for expl in answer:
+                canonical = table.canonical(expl)
+                _, answers = groups.setdefault(id(canonical), (canonical, []))
+                if not answers or answers[-1] != n:
+                    answers.append(n)
+        return list(groups.values())
+
+    def write_distinct_explanations(self, out: TextIO):
+        """Writes each distinct explanation once, preceded by the answer sets it belongs to. Unlike
+        write_explanations, nothing is written until every answer set has been explained.
+
+        Args:
+            out (TextIO): file-like object where the explanations are written.
+        """
+        for n, (expl, answers) in enumerate(self.explain_distinct(), 1):
+            out.write(f'Explanation {n} (answer sets: {" ".join(str(a) for a in answers)})\n')
+            expl.write_ascii_tree(out)
+            out.write('\n')
+
+    def _default_output(self):
+        out = StringIO()
+        self.write_explanations(out, flush=False)
+        return out.getvalue()
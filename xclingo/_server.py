@@ -0,0 +1,134 @@
+import os
+import socket
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from io import StringIO
+from urllib.parse import urlsplit, parse_qs
+
+from xclingo._main import XclingoControl
+from xclingo._client import parse_address, request_explanations
+
+
+class ExplanationServer:
+    """
+    Explains instances against a rule base which is translated once. Each instance is added to the rule base in its
+    own original and explainer controls, and only the instance is translated (see Explainer._resume_translation).
+
+    Args:
+        rules (str): the annotated rule base.
+        n_solutions (str, optional): default number of answer sets. Defaults to '1'.
+        n_explanations (str, optional): default number of explanations. Defaults to '1'.
+        options: any other argument of XclingoControl (auto_trace, persistent, joint, engine...).
+    """
+
+    def __init__(self, rules, n_solutions='1', n_explanations='1', **options):
+        self.rules = rules
+        self.n_solutions = n_solutions
+        self.n_explanations = n_explanations
+        self.options = options
+        # Translates the rule base (and scans the translation for the atoms it reads from the models), parses the
+        # explainer program and imports everything now instead of on the first request. The preprocessor of the rule
+        # base is pinned, so that it is not evicted by the translations of the instances
+        warm_up = XclingoControl(n_solutions, n_explanations, **options)
+        warm_up.add("base", [], rules)
+        warm_up.explainer._get_model_signatures()
+        warm_up.explainer._pin_translation()
+        warm_up.explainer._getExplainerAST(auto_trace=warm_up.explainer._auto_trace, joint=warm_up.explainer._joint)
+
+    def explain(self, facts, n_solutions=None, n_explanations=None, output_format="text", fields=None):
+        """Explains the rule base together with the given facts.
+
+        Args:
+            facts (str): the instance.
+            n_solutions (str, optional): number of answer sets. Defaults to the one of the server.
+            n_explanations (str, optional): number of explanations. Defaults to the one of the server.
+            output_format (str, optional): 'text', 'json' or 'ndjson' (see XclingoControl.write_explanations).
+                Defaults to 'text'.
+            fields (dict, optional): other fields added to every JSON object. Defaults to None.
+
+        Returns:
+            str: the explanations, as written by XclingoControl.write_explanations.
+        """
+        xcontrol = XclingoControl(
+            n_solutions if n_solutions is not None else self.n_solutions,
+            n_explanations if n_explanations is not None else self.n_explanations,
+            **self.options,
+        )
+        xcontrol.add("base", [], self.rules)
+        xcontrol.add("base", [], facts)
+        xcontrol.ground()
+        out = StringIO()
+        xcontrol.write_explanations(out, flush=False, output_format=output_format, fields=fields)
+        return out.getvalue()
+
+    def serve_forever(self, address):
+        """Serves explanations over HTTP until interrupted. Requests are handled one at a time.
+
+        POST /explain?n=N&e=E with the facts as body answers with the explanations as text/plain. GET /health
+        answers 'ok'.
+
+        Args:
+            address (str): 'unix:PATH' or '[HOST:]PORT' (see parse_address).
+        """
+        family, server_address = parse_address(address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(server_address):
+                os.remove(server_address)
+            server = _UnixHTTPServer(server_address, _ExplanationHandler)
+        else:
+            server = HTTPServer(server_address, _ExplanationHandler)
+        server.explanation_server = self
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if family == socket.AF_UNIX and os.path.exists(server_address):
+                os.remove(server_address)
+
+
+class _UnixHTTPServer(HTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind expects a (host, port) address
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+class _ExplanationHandler(BaseHTTPRequestHandler):
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def _reply(self, code, text):
+        body = text.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/health":
+            self._reply(200, "ok\n")
+        else:
+            self._reply(404, "not found\n")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/explain":
+            self._reply(404, "not found\n")
+            return
+        query = parse_qs(url.query)
+        facts = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        try:
+            text = self.server.explanation_server.explain(
+                facts,
+                n_solutions=query.get("n", [None])[0],
+                n_explanations=query.get("e", [None])[0],
+            )
+        except (RuntimeError, ValueError) as e:
+            # clingo raises RuntimeError for syntax and grounding errors, xclingo raises ValueError for bad options
+            self._reply(400, f"{e}\n")
+            return
+        self._reply(200, text)
@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+from time import perf_counter, process_time
+
+
+def _add_statistics(total, statistics):
+    """Adds the numbers of a clingo statistics dict to total, recursively. Lists (per thread values) are skipped."""
+    for key, value in statistics.items():
+        if isinstance(value, dict):
+            _add_statistics(total.setdefault(key, dict()), value)
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class Stats:
+    """
+    Time spent by an explainer in each phase, and the clingo statistics of the controls involved, aggregated over all
+    the answer sets explained.
+
+    The phases are:
+        translate: translating the annotated program.
+        parse: adding the explainer program and the translation to an explainer control.
+        inject: adding the atoms of the answer set to an explainer control.
+        ground: grounding an explainer control.
+        solve: solving an explainer control and building the explanations (walking the support graph, for the graph
+            engine).
+    """
+
+    PHASES = ("translate", "parse", "inject", "ground", "solve")
+
+    def __init__(self):
+        self.wall = dict.fromkeys(Stats.PHASES, 0.0)
+        self.cpu = dict.fromkeys(Stats.PHASES, 0.0)
+        self.models = 0
+        # Answer sets whose explanations were taken from the memo of the explainer
+        self.reused = 0
+        self.original = None
+        self._explainer_total = dict()
+        self._explainer_controls = dict()
+
+    @contextmanager
+    def phase(self, name):
+        wall, cpu = perf_counter(), process_time()
+        try:
+            yield
+        finally:
+            self.wall[name] += perf_counter() - wall
+            self.cpu[name] += process_time() - cpu
+
+    def add_explainer_statistics(self, statistics, key=None):
+        """Records the clingo statistics of an explainer control.
+
+        Args:
+            statistics (dict): the statistics of the control.
+            key (Hashable, optional): for controls which solve several times, an identifier of the control. Only the
+                last statistics of each key are kept, since clingo already accumulates them. Defaults to None.
+        """
+        if key is None:
+            _add_statistics(self._explainer_total, statistics)
+        else:
+            self._explainer_controls[key] = statistics
+
+    @property
+    def explainer(self):
+        """dict: the clingo statistics of all the explainer controls, added up."""
+        total = _add_statistics(dict(), self._explainer_total)
+        for statistics in self._explainer_controls.values():
+            _add_statistics(total, statistics)
+        return total
+
+    def merge(self, other, key=None):
+        """Adds the times and statistics of another Stats object (from a worker process, for instance).
+
+        Args:
+            other (Stats): the statistics to add.
+            key (Hashable, optional): identifies where the other statistics come from, so that the last statistics
+                of its controls which solve several times replace the previous ones. Defaults to None.
+        """
+        for phase in Stats.PHASES:
+            self.wall[phase] += other.wall[phase]
+            self.cpu[phase] += other.cpu[phase]
+        self.models += other.models
+        self.reused += other.reused
+        _add_statistics(self._explainer_total, other._explainer_total)
+        for control, statistics in other._explainer_controls.items():
+            self._explainer_controls[(key, control)] = statistics
+
+    def as_dict(self):
+        return dict(
+            models=self.models,
+            reused=self.reused,
+            wall=dict(self.wall),
+            cpu=dict(self.cpu),
+            original=self.original,
+            explainer=self.explainer,
+        )
+
+    @staticmethod
+    def _grounded(statistics):
+        lp = (statistics or dict()).get("problem", dict()).get("lp", dict())
+        return int(lp.get("atoms", 0)), int(lp.get("rules", 0))
+
+    def summary(self):
+        """Returns the statistics as text, in the style of clingo's --stats output."""
+        lines = [
+            "Explainer statistics",
+            f"  Answer sets  : {self.models}",
+            f"  Reused       : {self.reused}",
+            f"  {'Phase':<12} {'Wall (s)':>10} {'CPU (s)':>10}",
+        ]
+        for phase in Stats.PHASES:
+            lines.append(f"  {phase:<12} {self.wall[phase]:>10.3f} {self.cpu[phase]:>10.3f}")
+        lines.append(f"  {'total':<12} {sum(self.wall.values()):>10.3f} {sum(self.cpu.values()):>10.3f}")
+        if self.original is not None:
+            atoms, rules = Stats._grounded(self.original)
+            lines.append(f"  Original program  : {atoms} atoms, {rules} rules")
+        atoms, rules = Stats._grounded(self.explainer)
+        lines.append(f"  Explainer programs: {atoms} atoms, {rules} rules")
+        return "\n".join(lines) + "\n"
@@ -1 +1,3 @@
-from ._explanation import Explanation
\ No newline at end of file
+from ._explanation import Explanation, ExplanationTable
+from ._graph import CausalGraph
+from ._binary import ExplanationWriter, ExplanationReader
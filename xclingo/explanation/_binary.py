@@ -0,0 +1,234 @@
+"""
+Binary container for the explanations of many answer sets.
+
+    header      b"XCLE", version (1 byte)
+    records     one per explanation: the number of nodes, then, for every node but the root (node 0), its labels as
+                indexes of the string table and its parents as node indexes, each list preceded by its length. Nodes
+                are in Explanation.flatten order. Every number is a varint.
+    strings     the number of strings n (u64), n + 1 offsets (u64) relative to the first string, and the utf-8 texts.
+    answers     the number of answer sets m (u64), m + 1 indexes (u64) of the first explanation of each answer set in
+                the offset table, the number of explanations (u64) and the offset table: the position of each record
+                (u64).
+    footer      the positions of the strings and answers sections (u64), b"XCLE"
+
+Fixed width numbers are little endian. The tables at the end let a reader find any explanation without reading the
+rest of the file.
+"""
+
+import mmap
+import struct
+from array import array
+from sys import byteorder
+from typing import BinaryIO, Iterable, List
+
+from ._explanation import Explanation, ExplanationRoot, ExplanationNode, format_label
+
+
+_MAGIC = b"XCLE"
+_VERSION = 1
+_U64 = struct.Struct("<Q")
+_FOOTER = struct.Struct("<QQ4s")
+
+
+def _append_varint(buffer: bytearray, n: int):
+    while n >= 0x80:
+        buffer.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buffer.append(n)
+
+
+def _read_varint(data, position):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def _u64_array(values):
+    values = array("Q", values)
+    if byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+class ExplanationWriter:
+    """
+    Writes the explanations of successive answer sets to a binary file (see the module docstring). Each explanation
+    is written as soon as it is given; the string and offset tables are written by close.
+
+    Args:
+        fp (BinaryIO): a file opened for writing in binary mode.
+    """
+
+    def __init__(self, fp: BinaryIO):
+        self._fp = fp
+        self._strings = dict()
+        self._offsets = array("Q")
+        self._answers = array("Q")
+        self._position = 0
+        self._write(_MAGIC + bytes([_VERSION]))
+
+    def _write(self, data):
+        self._fp.write(data)
+        self._position += len(data)
+
+    def _string(self, text):
+        index = self._strings.get(text, None)
+        if index is None:
+            index = self._strings[text] = len(self._strings)
+        return index
+
+    def write_answer(self, explanations: Iterable[Explanation]):
+        """Writes the explanations of the next answer set."""
+        self._answers.append(len(self._offsets))
+        for explanation in explanations:
+            self._offsets.append(self._position)
+            nodes, causes = explanation.flatten()
+            parents = [[] for _ in nodes]
+            for parent, node_causes in enumerate(causes):
+                for cause in node_causes:
+                    parents[cause].append(parent)
+            record = bytearray()
+            _append_varint(record, len(nodes))
+            for node, node_parents in zip(nodes[1:], parents[1:]):
+                labels = sorted({format_label(label) for label in node.labels})
+                _append_varint(record, len(labels))
+                for label in labels:
+                    _append_varint(record, self._string(label))
+                _append_varint(record, len(node_parents))
+                for parent in node_parents:
+                    _append_varint(record, parent)
+            self._write(record)
+
+    def close(self):
+        """Writes the tables. The file itself is not closed."""
+        strings_position = self._position
+        texts = [text.encode() for text in self._strings]
+        offsets = [0]
+        for text in texts:
+            offsets.append(offsets[-1] + len(text))
+        self._write(_U64.pack(len(texts)))
+        self._write(_u64_array(offsets))
+        for text in texts:
+            self._write(text)
+
+        answers_position = self._position
+        self._write(_U64.pack(len(self._answers)))
+        self._write(_u64_array(list(self._answers) + [len(self._offsets)]))
+        self._write(_U64.pack(len(self._offsets)))
+        self._write(_u64_array(self._offsets))
+        self._write(_FOOTER.pack(strings_position, answers_position, _MAGIC))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class ExplanationReader:
+    """
+    Reads a file written by ExplanationWriter. The file is memory-mapped and each explanation is only decoded when
+    it is asked for, so any explanation can be read without reading the rest of the file.
+
+    Args:
+        path (str): path of the file.
+
+    Raises:
+        ValueError: if the file is not an explanation container of a known version.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._data
+        if data[:4] != _MAGIC or data[-4:] != _MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an explanation file")
+        if data[4] != _VERSION:
+            self.close()
+            raise ValueError(f"{path} has version {data[4]}, expected {_VERSION}")
+
+        strings_position, answers_position, _ = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)
+        (n_strings,) = _U64.unpack_from(data, strings_position)
+        self._string_offsets = strings_position + _U64.size
+        self._string_data = self._string_offsets + _U64.size * (n_strings + 1)
+        self._labels = dict()
+
+        (self._n_answers,) = _U64.unpack_from(data, answers_position)
+        self._answer_index = answers_position + _U64.size
+        explanations_position = self._answer_index + _U64.size * (self._n_answers + 1)
+        self._explanation_offsets = explanations_position + _U64.size
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self):
+        """The number of answer sets."""
+        return self._n_answers
+
+    def _u64(self, table, i):
+        return _U64.unpack_from(self._data, table + _U64.size * i)[0]
+
+    def _label(self, i):
+        label = self._labels.get(i, None)
+        if label is None:
+            start, end = self._u64(self._string_offsets, i), self._u64(self._string_offsets, i + 1)
+            label = self._labels[i] = bytes(self._data[self._string_data + start:self._string_data + end]).decode()
+        return label
+
+    def _answer_range(self, answer):
+        if not 0 <= answer < self._n_answers:
+            raise IndexError(f"answer set {answer} out of range")
+        return self._u64(self._answer_index, answer), self._u64(self._answer_index, answer + 1)
+
+    def count(self, answer: int) -> int:
+        """The number of explanations of the answer set (starting at 0)."""
+        first, last = self._answer_range(answer)
+        return last - first
+
+    def explanation(self, answer: int, k: int) -> Explanation:
+        """Decodes explanation k of an answer set, both starting at 0."""
+        first, last = self._answer_range(answer)
+        if not 0 <= k < last - first:
+            raise IndexError(f"explanation {k} out of range")
+        data = self._data
+        n_nodes, position = _read_varint(data, self._u64(self._explanation_offsets, first + k))
+        nodes = [ExplanationRoot()]
+        parents = [()]
+        for _ in range(n_nodes - 1):
+            n_labels, position = _read_varint(data, position)
+            labels = []
+            for _ in range(n_labels):
+                label, position = _read_varint(data, position)
+                labels.append(self._label(label))
+            n_parents, position = _read_varint(data, position)
+            node_parents = []
+            for _ in range(n_parents):
+                parent, position = _read_varint(data, position)
+                node_parents.append(parent)
+            nodes.append(ExplanationNode(labels=labels))
+            parents.append(node_parents)
+        for node, node_parents in zip(nodes, parents):
+            for parent in node_parents:
+                nodes[parent].add_cause(node)
+        return nodes[0]
+
+    def answer(self, answer: int) -> List[Explanation]:
+        """Decodes every explanation of an answer set (starting at 0)."""
+        return [self.explanation(answer, k) for k in range(self.count(answer))]
+
+    def __iter__(self):
+        for answer in range(self._n_answers):
+            yield self.answer(answer)
@@ -1,35 +1,171 @@
-from typing import Iterable
-from clingo import Symbol
+import json
+from collections.abc import MutableSequence
+from functools import lru_cache
+from io import StringIO
+from sys import intern
+from typing import Iterable, TextIO
+from clingo import Function, Symbol, parse_term
+from clingo.symbol import SymbolType
+
+
+@lru_cache(maxsize=2 ** 16)
+def format_label(label):
+    """Returns the text of a label. Labels are kept as they come from the explainer until a node is printed: a
+    (template, arguments) tuple for the traces, in which every '%' of the template is replaced by the next argument,
+    any other symbol (the atom itself, when it is traced automatically), or an already formatted string.
+
+    Args:
+        label (Union[clingo.Symbol, str]): the label.
+
+    Returns:
+        str: the text of the label.
+    """
+    if isinstance(label, str):
+        return label
+    if label.type == SymbolType.String:
+        return label.string
+    if label.type == SymbolType.Function and label.name == "" and len(label.arguments) == 2:
+        template, arguments = label.arguments
+        if template.type == SymbolType.String:
+            pieces = template.string.split("%", len(arguments.arguments))
+            text = [pieces[0]]
+            for value, piece in zip(arguments.arguments, pieces[1:]):
+                text.append(value.string if value.type == SymbolType.String else str(value))
+                text.append(piece)
+            # Arguments beyond the last '%' are ignored, and '%' beyond the last argument are kept
+            return "".join(text)
+    return str(label)
+
+
+def _intern_label(label):
+    return intern(label) if isinstance(label, str) else label
+
+
+class _LazyTable:
+    """The _xclingo_label_tree atoms of a model indexed by parent, from which the nodes of the explanations are created
+    the first time they are reached."""
+
+    __slots__ = ("children", "labels", "nodes")
+
+    def __init__(self):
+        self.children = dict()
+        self.labels = dict()
+        self.nodes = dict()
+
+    def node(self, symbol):
+        node = self.nodes.get(symbol, None)
+        if node is None:
+            node = ExplanationNode(labels=self.labels[symbol], causes=_LazyCauses(self, symbol))
+            self.nodes[symbol] = node
+        return node
+
+
+class _LazyCauses(MutableSequence):
+    """The causes of a node, which are only created when they are accessed for the first time."""
+
+    __slots__ = ("_table", "_parent", "_items")
+
+    def __init__(self, table, parent):
+        self._table = table
+        self._parent = parent
+        self._items = None
+
+    def _materialize(self):
+        if self._items is None:
+            self._items = [self._table.node(child) for child in self._table.children.get(self._parent, ())]
+            self._table = None
+        return self._items
+
+    def __getitem__(self, i):
+        return self._materialize()[i]
+
+    def __setitem__(self, i, value):
+        self._materialize()[i] = value
+
+    def __delitem__(self, i):
+        del self._materialize()[i]
+
+    def __len__(self):
+        return len(self._materialize())
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def insert(self, i, value):
+        self._materialize().insert(i, value)
 
 
 class Explanation:
+    __slots__ = ()
+
+    @staticmethod
+    def _is_root(symbol: Symbol):
+        return symbol.type == SymbolType.Function and symbol.name == "root"
+
     @staticmethod
-    def from_model(symbols: Iterable[Symbol]):
+    def _build_table(symbols: Iterable[Symbol]):
         table = dict()
+        roots = dict()
+        edges = set()
         for s in symbols:
-            parent = str(s.arguments[0])
-            child = str(s.arguments[1])
+            parent, child, label = s.arguments
             child_item = table.get(child, None)
             parent_item = table.get(parent, None)
 
             if child_item is None:
                 child_item = ExplanationNode()
                 table[child] = child_item
-            child_item.add_label(str(s.arguments[2]).strip('"'))
+            child_item.add_label(label)
 
             if parent_item is None:
-                parent_item = (
-                    ExplanationRoot(explanation_atoms=symbols)
-                    if parent == "root"
-                    else ExplanationNode()
-                )
-                parent_item.add_cause(child_item)
+                if Explanation._is_root(parent):
+                    parent_item = ExplanationRoot(explanation_atoms=symbols)
+                    roots[parent] = parent_item
+                else:
+                    parent_item = ExplanationNode()
                 table[parent] = parent_item
 
-            if child_item not in parent_item.causes:
+            if (parent, child) not in edges:
+                edges.add((parent, child))
                 parent_item.add_cause(child_item)
 
-        return table["root"]
+        return table, roots
+
+    @staticmethod
+    def _build_lazy_roots(symbols: Iterable[Symbol]):
+        table = _LazyTable()
+        roots = dict()
+        for s in symbols:
+            parent, child, label = s.arguments
+            table.children.setdefault(parent, dict())[child] = None
+            table.labels.setdefault(child, []).append(label)
+            if parent not in roots and Explanation._is_root(parent):
+                roots[parent] = ExplanationRoot(causes=_LazyCauses(table, parent), explanation_atoms=symbols)
+        return roots
+
+    @staticmethod
+    def from_model(symbols: Iterable[Symbol], lazy: bool = False):
+        """Builds the explanation of a model of the explainer.
+
+        Args:
+            symbols (Iterable[clingo.Symbol]): the _xclingo_label_tree/3 atoms of the model.
+            lazy (bool, optional): if True, the atoms are only indexed and the nodes are created as they are reached
+                while traversing the tree. Defaults to False.
+        """
+        if lazy:
+            return Explanation._build_lazy_roots(symbols)[Function("root", [])]
+        table, _ = Explanation._build_table(symbols)
+        return table[Function("root", [])]
+
+    @staticmethod
+    def from_joint_model(symbols: Iterable[Symbol], lazy: bool = False):
+        """Splits a model in which several atoms have been explained at once (each one under its own root(Atom)
+        node) into one explanation per atom, sorted by atom. The explanations may share subtrees."""
+        if lazy:
+            roots = Explanation._build_lazy_roots(symbols)
+        else:
+            _, roots = Explanation._build_table(symbols)
+        return [root for _, root in sorted(roots.items(), key=lambda r: r[0])]
 
     @staticmethod
     def ascii_branch(level):
@@ -51,38 +187,72 @@ class Explanation:
                 stack.pop()
                 level += -1
 
-    def ascii_tree(self):
-        expl = ""
+    def write_ascii_tree(self, out: TextIO):
+        """Writes the tree to a file-like object, one line per node, without building the whole text in memory."""
+        write = out.write
         for node, level in self.preorder_iterator():
-            expl += "{branch}{text}\n".format(
-                branch=Explanation.ascii_branch(level),
-                text=node.get_node_text(),
-            )
-        return expl
+            write(Explanation.ascii_branch(level))
+            write(node.get_node_text())
+            write("\n")
 
-    def is_equal(self, other):
-        if not isinstance(other, Explanation):
-            return False
+    def ascii_tree(self):
+        out = StringIO()
+        self.write_ascii_tree(out)
+        return out.getvalue()
 
-        for (node1, level1), (node2, level2) in zip(
-            self.preorder_iterator(), other.preorder_iterator()
-        ):
-            if not node1._node_equals(node2):
-                return False
+    def flatten(self):
+        """Returns the nodes of the explanation in breadth-first order, each shared subtree only once, and the causes
+        of every node as positions in that list. Unlike preorder_iterator, it does not recurse into shared
+        subtrees."""
+        index = {id(self): 0}
+        nodes = [self]
+        i = 0
+        while i < len(nodes):
+            for cause in nodes[i].causes:
+                if id(cause) not in index:
+                    index[id(cause)] = len(nodes)
+                    nodes.append(cause)
+            i += 1
+        return nodes, [[index[id(cause)] for cause in node.causes] for node in nodes]
 
-            if level1 != level2:
-                return False
+    def to_dict(self):
+        """Returns the explanation as a JSON serialisable dict: the nodes, each one with its id (its position in
+        flatten) and the texts of its labels, and the (parent, child) edges. The root is node 0 and has no labels."""
+        nodes, causes = self.flatten()
+        return {
+            "nodes": [
+                {"id": i, "labels": sorted({format_label(label) for label in getattr(node, "labels", ())})}
+                for i, node in enumerate(nodes)
+            ],
+            "edges": [[i, j] for i, node_causes in enumerate(causes) for j in node_causes],
+        }
 
-        return True
+    def write_json(self, out: TextIO, **fields):
+        """Writes the explanation to a file-like object as a JSON object (see to_dict), with any other given
+        fields. The text is written as it is encoded."""
+        record = dict(fields)
+        record.update(self.to_dict())
+        json.dump(record, out)
+
+    def is_equal(self, other):
+        """Whether both explanations have the same structure: the same labels in every node and the same causes,
+        in any order."""
+        if not isinstance(other, Explanation):
+            return False
+        table = ExplanationTable()
+        return table.canonical(self, share=False) is table.canonical(other, share=False)
 
     def add_cause(self, cause):
         self.causes.append(cause)
 
     def add_label(self, label):
-        self.labels.add(label)
+        if label not in self.labels:
+            self.labels += (_intern_label(label),)
 
 
 class ExplanationRoot(Explanation):
+    __slots__ = ("causes", "_explanation_atoms")
+
     def __init__(self, causes=None, explanation_atoms=None):
         self.causes = list() if causes is None else causes
         self._explanation_atoms = explanation_atoms
@@ -90,6 +260,17 @@ class ExplanationRoot(Explanation):
     def get_node_text(self):
         return "  *"
 
+    def __reduce__(self):
+        # Pickled as a flat list of nodes: long explanations would exceed the recursion limit otherwise, and the
+        # explanation atoms are kept as text because clingo symbols can not be pickled.
+        nodes, causes = self.flatten()
+        flat = [
+            (None if node is self else sorted({format_label(label) for label in node.labels}), node_causes)
+            for node, node_causes in zip(nodes, causes)
+        ]
+        atoms = None if self._explanation_atoms is None else [str(a) for a in self._explanation_atoms]
+        return (_unpickle_explanation, (flat, atoms))
+
     def _node_equals(self, other):
         if not isinstance(other, ExplanationRoot):
             return False
@@ -100,20 +281,91 @@ class ExplanationRoot(Explanation):
 class ExplanationNode(Explanation):
     """
     A non-binary tree.
+
+    Nodes have no __dict__. The labels are kept as a tuple, since most nodes have a single label. They are only
+    formatted (see format_label) when the node is printed; the texts given as strings are interned.
     """
 
+    __slots__ = ("labels", "causes")
+
     def __init__(self, labels=None, causes=None):
-        self.labels = set() if labels is None else labels
+        self.labels = () if labels is None else tuple(dict.fromkeys(_intern_label(label) for label in labels))
         self.causes = list() if causes is None else causes
 
     def get_node_text(self):
-        return ";".join(sorted(list(self.labels)))
+        return ";".join(sorted({format_label(label) for label in self.labels}))
 
     def _node_equals(self, other):
         if not isinstance(other, ExplanationNode):
             return False
 
-        if self.label.replace_values() != other.label.replace_values():
+        if {format_label(label) for label in self.labels} != {format_label(label) for label in other.labels}:
             return False
 
         return True
+
+
+class ExplanationTable:
+    """
+    Hash-consing table of explanations. Every subtree added to the table is replaced by the first structurally equal
+    subtree it has seen, so identical subtrees (the same labels and the same causes, in any order) are shared in
+    memory and two canonical explanations are equal if and only if they are the same object.
+    """
+
+    __slots__ = ("_nodes",)
+
+    def __init__(self):
+        # structural key -> canonical node. Keys refer to the causes by the id of their canonical node, which lives
+        # as long as the table.
+        self._nodes = dict()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @staticmethod
+    def _labels_key(node):
+        if isinstance(node, ExplanationRoot):
+            return None
+        return tuple(sorted({format_label(label) for label in node.labels}))
+
+    def canonical(self, explanation: Explanation, share: bool = True) -> Explanation:
+        """Returns the canonical explanation structurally equal to the given one, adding it to the table if none
+        was there.
+
+        Args:
+            explanation (Explanation): the explanation.
+            share (bool, optional): if True, the causes of every node are replaced by their canonical subtrees, so
+                the explanation no longer holds duplicated subtrees. Otherwise the explanation is not modified.
+                Defaults to True.
+
+        Returns:
+            Explanation: the canonical explanation.
+        """
+        canonical = dict()  # id(node) -> canonical node, for the subtrees shared inside the explanation
+        stack = [(explanation, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in canonical:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((cause, False) for cause in node.causes if id(cause) not in canonical)
+                continue
+            causes = [canonical[id(cause)] for cause in node.causes]
+            key = (ExplanationTable._labels_key(node), tuple(sorted(id(cause) for cause in causes)))
+            found = self._nodes.get(key, None)
+            if found is None:
+                found = self._nodes[key] = node
+                if share:
+                    node.causes = causes
+            canonical[id(node)] = found
+        return canonical[id(explanation)]
+
+
+def _unpickle_explanation(flat, atoms):
+    root = ExplanationRoot(explanation_atoms=None if atoms is None else [parse_term(a) for a in atoms])
+    nodes = [root] + [ExplanationNode(labels=labels) for labels, _ in flat[1:]]
+    for node, (_, causes) in zip(nodes, flat):
+        for i in causes:
+            node.add_cause(nodes[i])
+    return root
@@ -0,0 +1,131 @@
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+from clingo import Symbol
+
+from ._explanation import ExplanationRoot, ExplanationNode
+
+
+class CausalGraph:
+    """
+    Support graph of a model, built from the ground _xclingo_sup/3 atoms of the explainer.
+
+    Each atom is given a single support: the first rule (lowest rule id) by which it can be derived from atoms that
+    already have one, so the chosen supports never form a cycle. This corresponds to the first explanation that the
+    explainer program would find for every atom.
+    """
+
+    def __init__(
+        self,
+        supports: Iterable[Tuple[Symbol, Symbol, Symbol]],
+        bodies: Dict[Tuple[Symbol, Symbol], List[Symbol]],
+        muted: Iterable[Symbol] = (),
+    ):
+        """
+        Args:
+            supports (Iterable[Tuple[Symbol, Symbol, Symbol]]): (rule id, atom, body instance) triples.
+            bodies (Dict[Tuple[Symbol, Symbol], List[Symbol]]): the atoms of the body of each (rule id, body
+                instance), from the _xclingo_body/4 atoms.
+            muted (Iterable[Symbol]): atoms which can not be part of an explanation.
+        """
+        self._muted = set(muted)
+        self._bodies = bodies
+        self._support = self._first_supports(sorted(supports, key=lambda s: s[0]), bodies)
+
+    @staticmethod
+    def _first_supports(supports, bodies):
+        missing = []
+        waiting = dict()
+        queue = deque()
+        for i, (rule_id, _, body) in enumerate(supports):
+            body_atoms = set(bodies.get((rule_id, body), ()))
+            missing.append(len(body_atoms))
+            if not body_atoms:
+                queue.append(i)
+            for atom in body_atoms:
+                waiting.setdefault(atom, []).append(i)
+
+        chosen = dict()
+        while queue:
+            rule_id, atom, body = supports[queue.popleft()]
+            if atom in chosen:
+                continue
+            chosen[atom] = (rule_id, body)
+            for i in waiting.pop(atom, ()):
+                missing[i] -= 1
+                if missing[i] == 0:
+                    queue.append(i)
+        return chosen
+
+    def support(self, atom: Symbol):
+        """Returns the (rule id, body instance) chosen for the atom, or None if the atom has no well-founded support."""
+        return self._support.get(atom, None)
+
+    def causes(self, atom: Symbol):
+        """Returns the atoms in the chosen support of the atom which are not muted."""
+        return [a for a in self._bodies.get(self._support[atom], ()) if a not in self._muted]
+
+    def _postorder(self, roots: Iterable[Symbol]):
+        order = []
+        visited = set()
+        for root in roots:
+            if root in visited or root not in self._support:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self.causes(root)))]
+            while stack:
+                atom, causes = stack[-1]
+                for cause in causes:
+                    if cause not in visited and cause in self._support:
+                        visited.add(cause)
+                        stack.append((cause, iter(self.causes(cause))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(atom)
+        return order
+
+    def tree_atoms(self, roots: Iterable[Symbol]):
+        """Returns the atoms which appear in the explanations of the given atoms, with their chosen support."""
+        return {atom: self._support[atom] for atom in self._postorder(roots)}
+
+    def explanations(self, roots: Iterable[Symbol], labels):
+        """Builds one explanation for each of the given atoms, skipping the atoms which can not be explained or whose
+        explanation contains no labelled atom. Unlabelled atoms are collapsed, so the causes of a labelled atom are
+        its closest labelled descendants.
+
+        Args:
+            roots (Iterable[Symbol]): the atoms to be explained.
+            labels (Dict[Symbol, Iterable[Symbol]]): the labels of each atom.
+
+        Returns:
+            List[ExplanationRoot]: the explanations.
+        """
+        roots = list(roots)
+        nodes = dict()
+        closest_labelled = dict()
+        for atom in self._postorder(roots):
+            causes = []
+            seen = set()
+            for cause in self.causes(atom):
+                if cause not in self._support:
+                    continue
+                for item in [nodes[cause]] if cause in nodes else closest_labelled[cause]:
+                    if id(item) not in seen:
+                        seen.add(id(item))
+                        causes.append(item)
+            if atom in labels:
+                item = ExplanationNode(causes=causes)
+                for label in labels[atom]:
+                    item.add_label(label)
+                nodes[atom] = item
+            else:
+                closest_labelled[atom] = causes
+
+        explanations = []
+        for atom in roots:
+            if atom not in self._support:
+                continue
+            causes = [nodes[atom]] if atom in nodes else closest_labelled[atom]
+            if causes:
+                explanations.append(ExplanationRoot(causes=list(causes)))
+        return explanations
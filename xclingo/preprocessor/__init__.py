@@ -1 +1,2 @@
-from ._preprocessor import Preprocessor
\ No newline at end of file
+from ._preprocessor import Preprocessor
+from ._cache import TranslationCache
\ No newline at end of file
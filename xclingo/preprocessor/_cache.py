@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+from clingo import ast
+
+from xclingo._version import __version__
+
+
+class TranslationCache:
+    """
+    Cache of program translations. Translations are kept as lists of AST statements in an in-memory memo shared by
+    every instance of the process and, optionally, as files inside a cache directory so they survive across processes.
+    Each translation is kept together with the malformed annotations found while translating, so that they can be
+    reported again without scanning the programs.
+    """
+
+    _memo = OrderedDict()
+    memo_size = 32
+    # Changes whenever the translations written to disk by a previous version can not be read back
+    _format = 6
+    _diagnostics_prefix = "% xclingo diagnostics: "
+
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir
+
+    @staticmethod
+    def key(programs, *options):
+        """Returns the key of the translation of the given programs.
+
+        Args:
+            programs (Iterable[Tuple[str, Sequence[str], str]]): (name, parameters, program) triples, in the order
+                they were added.
+            options (str): any other setting that changes the translation.
+
+        Returns:
+            str: a hex digest identifying the translation.
+        """
+        digest = hashlib.sha256()
+        for part in (__version__, TranslationCache._format) + options:
+            digest.update(str(part).encode())
+            digest.update(b"\0")
+        for name, parameters, program in programs:
+            digest.update(name.encode())
+            digest.update(b"\0")
+            digest.update(",".join(parameters).encode())
+            digest.update(b"\0")
+            digest.update(program.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, f"{key}.lp")
+
+    def _remember(self, key, entry):
+        TranslationCache._memo[key] = entry
+        TranslationCache._memo.move_to_end(key)
+        while len(TranslationCache._memo) > TranslationCache.memo_size:
+            TranslationCache._memo.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached translation for the key, or None if it has not been cached."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key):
+        """Returns the cached translation for the key and its diagnostics, as given to set, or None if it has not been
+        cached."""
+        entry = TranslationCache._memo.get(key, None)
+        if entry is not None:
+            TranslationCache._memo.move_to_end(key)
+            return entry
+
+        if self._cache_dir is not None and os.path.isfile(self._path(key)):
+            translation = []
+            with open(self._path(key), "r") as fp:
+                text = fp.read()
+            header, _, text = text.partition("\n")
+            diagnostics = [tuple(d) for d in json.loads(header[len(TranslationCache._diagnostics_prefix):])]
+            ast.parse_string(text, translation.append)
+            # The implicit '#program base.' added by the parser is not part of the translation
+            entry = (translation[1:], diagnostics)
+            self._remember(key, entry)
+
+        return entry
+
+    def set(self, key, translation, diagnostics=()):
+        """Stores the translation for the key in memory and, if a cache directory was given, on disk.
+
+        Args:
+            key (str): the key of the translation (see key).
+            translation (List[clingo.ast.AST]): the translated statements.
+            diagnostics (Iterable[Tuple[str, int, int, str]], optional): the (program name, line, column, text) of
+                every malformed annotation of the programs. Defaults to ().
+        """
+        diagnostics = [tuple(d) for d in diagnostics]
+        self._remember(key, (translation, diagnostics))
+
+        if self._cache_dir is not None:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as fp:
+                # A comment, so the file is still a valid program
+                fp.write(f"{TranslationCache._diagnostics_prefix}{json.dumps(diagnostics)}\n")
+                for statement in translation:
+                    fp.write(f"{statement}\n")
+            os.replace(tmp_path, self._path(key))
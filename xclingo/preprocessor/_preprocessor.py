@@ -1,9 +1,14 @@
+from collections import namedtuple
 from clingo.symbol import Number
 from ._utils import (
-    translate_show_all,
-    translate_trace,
-    translate_trace_all,
-    translate_mute,
+    scan_annotations,
+    translate_annotations,
+    model_signatures,
+    term_signature,
+    body_signatures,
+    is_full_mute,
+    variable_names,
+    name_anonymous_variables,
     is_xclingo_label,
     is_xclingo_show_trace,
     is_choice_rule,
@@ -15,11 +20,37 @@ from ._utils import (
 from clingo import ast
 
 
+# The signatures of the head and the body of a rule are kept in signatures, and the statements it is translated into
+# in translations, by whether its head is muted or not, since the rule may be translated again with more programs added
+# on top of it (see Preprocessor.copy)
+_UserRule = namedtuple(
+    "_UserRule", ["rule_id", "rule_ast", "trace_rule", "parameters", "signatures", "translations"]
+)
+
+
 class Preprocessor:
     def __init__(self):
         self._rule_count = 1
         self._last_trace_rule = None
-        self._translation = ""
+        self._parameters = ()
+        self._translation = []
+        self._traced = set()
+        self._muted = set()
+        self.malformed_annotations = []
+
+    def copy(self):
+        """Returns a preprocessor in the same state, so that more programs can be translated on top of the ones this
+        one has already translated. The statements translated so far are shared, not copied, and so are the
+        translations of their rules."""
+        other = Preprocessor()
+        other._rule_count = self._rule_count
+        other._last_trace_rule = self._last_trace_rule
+        other._parameters = self._parameters
+        other._translation = list(self._translation)
+        other._traced = set(self._traced)
+        other._muted = set(self._muted)
+        other.malformed_annotations = list(self.malformed_annotations)
+        return other
 
     def increment_rule_count(self):
         n = self._rule_count
@@ -28,13 +59,37 @@ class Preprocessor:
 
     @staticmethod
     def translate_annotations(program):
-        return translate_trace_all(translate_show_all(translate_trace(translate_mute(program))))
+        return translate_annotations(program)
+
+    @staticmethod
+    def model_signatures(statements):
+        return model_signatures(statements)
 
     def propagates(self, lit_list):
         for lit in lit_list:
             if lit.sign == ast.Sign.NoSign and lit.atom.ast_type == ast.ASTType.SymbolicAtom:
                 yield lit
 
+    def body_instance(self, lit_list, parameters=()):
+        """Returns the term which tells apart the instances of a rule body (rules are unpooled before they are
+        translated). If its positive atoms have no variables, it is the tuple of those atoms, or the constant empty if
+        it has none. Otherwise it is the tuple of their variables, the parameters of the program part of the rule and
+        the atoms without variables, since the variables alone do not determine those."""
+        loc = ast.Location(
+            ast.Position("", 0, 0),
+            ast.Position("", 0, 0),
+        )
+        atoms = [lit.atom.symbol for lit in self.propagates(lit_list)]
+        if len(atoms) == 0:
+            return ast.Function(loc, "empty", [], False)
+        names = variable_names(atoms)
+        if len(names) == 0:
+            return ast.Function(loc, "", atoms, False)
+        terms = [ast.Variable(loc, name) for name in names]
+        terms.extend(ast.Function(loc, p, [], False) for p in parameters)
+        terms.extend(atom for atom in atoms if len(variable_names([atom])) == 0)
+        return ast.Function(loc, "", terms, False)
+
     def sup_body(self, lit_list):
         loc = ast.Location(
             ast.Position("", 0, 0),
@@ -81,7 +136,7 @@ class Preprocessor:
             else:
                 yield lit
 
-    def sup_head(self, rule_id, rule_ast):
+    def sup_head(self, rule_id, rule_ast, parameters=()):
         loc = ast.Location(
             ast.Position("", 0, 0),
             ast.Position("", 0, 0),
@@ -95,8 +150,8 @@ class Preprocessor:
                     "_xclingo_sup",
                     [
                         ast.SymbolicTerm(loc, Number(rule_id)),
-                        rule_ast.head.atom,
-                        ast.Function(loc, "", list(self.propagates(rule_ast.body)), False),  # tuple
+                        rule_ast.head.atom.symbol,
+                        self.body_instance(rule_ast.body, parameters),
                     ],
                     False,
                 ),
@@ -104,17 +159,56 @@ class Preprocessor:
         )
         return head
 
-    def support_rule(self, rule_id, rule_ast):
+    def support_rule(self, rule_id, rule_ast, parameters=()):
         loc = ast.Location(
             ast.Position("", 0, 0),
             ast.Position("", 0, 0),
         )
-        head = self.sup_head(rule_id, rule_ast)
+        head = self.sup_head(rule_id, rule_ast, parameters)
         body = list(self.sup_body(rule_ast.body))
 
         return ast.Rule(loc, head, body)
 
-    def fbody_head(self, rule_id, rule_ast):
+    def body_rules(self, rule_id, rule_ast, parameters=()):
+        """Yields a _xclingo_body(RuleID, Instance, Position, Atom) rule for each positive atom of the body."""
+        loc = ast.Location(
+            ast.Position("", 0, 0),
+            ast.Position("", 0, 0),
+        )
+        instance = self.body_instance(rule_ast.body, parameters)
+        sup = ast.Literal(
+            loc,
+            ast.Sign.NoSign,
+            ast.SymbolicAtom(
+                ast.Function(
+                    loc,
+                    "_xclingo_sup",
+                    [ast.SymbolicTerm(loc, Number(rule_id)), ast.Variable(loc, "_"), instance],
+                    False,
+                )
+            ),
+        )
+        for position, lit in enumerate(self.propagates(rule_ast.body)):
+            head = ast.Literal(
+                loc,
+                ast.Sign.NoSign,
+                ast.SymbolicAtom(
+                    ast.Function(
+                        loc,
+                        "_xclingo_body",
+                        [
+                            ast.SymbolicTerm(loc, Number(rule_id)),
+                            instance,
+                            ast.SymbolicTerm(loc, Number(position)),
+                            lit.atom.symbol,
+                        ],
+                        False,
+                    )
+                ),
+            )
+            yield ast.Rule(loc, head, [sup])
+
+    def fbody_head(self, rule_id, rule_ast, parameters=()):
         loc = ast.Location(
             ast.Position("", 0, 0),
             ast.Position("", 0, 0),
@@ -128,8 +222,8 @@ class Preprocessor:
                     "_xclingo_fbody",
                     [
                         ast.SymbolicTerm(loc, Number(rule_id)),
-                        rule_ast.head.atom,
-                        ast.Function(loc, "", list(self.propagates(rule_ast.body)), False),  # tuple
+                        rule_ast.head.atom.symbol,
+                        self.body_instance(rule_ast.body, parameters),
                     ],
                     False,
                 ),
@@ -196,21 +290,21 @@ class Preprocessor:
             else:
                 yield lit
 
-    def fbody_rule(self, rule_id, rule_ast):
+    def fbody_rule(self, rule_id, rule_ast, parameters=()):
         loc = ast.Location(
             ast.Position("", 0, 0),
             ast.Position("", 0, 0),
         )
-        head = self.fbody_head(rule_id, rule_ast)
+        head = self.fbody_head(rule_id, rule_ast, parameters)
         body = list(self.fbody_body(rule_ast.body))
         return ast.Rule(loc, head, body)
 
-    def label_rule(self, rule_id, label_rule_ast, rule_body):
+    def label_rule(self, rule_id, label_rule_ast, rule_body, parameters=(), head_term=None, conditions=()):
         loc = ast.Location(
             ast.Position("", 0, 0),
             ast.Position("", 0, 0),
         )
-        head_var = ast.Variable(loc, "Head")
+        head_var = ast.Variable(loc, "Head") if head_term is None else head_term
         head = ast.Literal(
             loc,
             label_rule_ast.head.sign,
@@ -234,18 +328,14 @@ class Preprocessor:
                         [
                             ast.SymbolicTerm(loc, Number(rule_id)),
                             head_var,
-                            ast.Function(
-                                loc,
-                                "",
-                                list(self.propagates(rule_body)),
-                                False,
-                            ),
+                            self.body_instance(rule_body, parameters),
                         ],
                         False,
                     )
                 ),
             )
         ]
+        body.extend(conditions)
         rule = ast.Rule(loc, head, body)
         return rule
 
@@ -301,12 +391,51 @@ class Preprocessor:
         return rule
 
     def add_to_translation(self, a):
-        self._translation += f"{a}\n"
+        self._translation.append(a)
 
     def add_comment_to_translation(self, a):
-        self._translation += f"% {a}\n"
+        self._translation.append(f"% {a}")
+
+    def add_rule_to_translation(self, rule_id, rule_ast, trace_rule):
+        # Rules are translated once the whole program is known, so that they can be sliced (see relevant_signatures).
+        # Pools are expanded here, so that each expansion has its own body instances (see body_instance)
+        for unpooled in rule_ast.unpool():
+            signatures = (term_signature(unpooled.head.atom.symbol), frozenset(body_signatures(unpooled.body)))
+            self._translation.append(_UserRule(rule_id, unpooled, trace_rule, self._parameters, signatures, dict()))
+
+    def rule_translation(self, rule, muted=False):
+        rule_id, rule_ast, trace_rule, parameters, _, _ = rule
+        if muted:
+            # The causes of a muted atom never reach an explanation, so its body is only checked against the model
+            loc = ast.Location(
+                ast.Position("", 0, 0),
+                ast.Position("", 0, 0),
+            )
+            bodiless = ast.Rule(loc, rule_ast.head, [])
+            body = list(self.sup_body(rule_ast.body))
+            statements = [
+                ast.Rule(loc, self.sup_head(rule_id, bodiless, parameters), body),
+                ast.Rule(loc, self.fbody_head(rule_id, bodiless, parameters), body),
+            ]
+            if trace_rule is not None:
+                # The empty body tuple does not bind the variables of the label, the head and the body do
+                statements.append(self.label_rule(
+                    rule_id, trace_rule, [], parameters, head_term=rule_ast.head.atom.symbol, conditions=body
+                ))
+        else:
+            rule_ast = name_anonymous_variables(rule_ast)
+            statements = [self.support_rule(rule_id, rule_ast, parameters)]
+            statements.extend(self.body_rules(rule_id, rule_ast, parameters))
+            statements.append(self.fbody_rule(rule_id, rule_ast, parameters))
+            if trace_rule is not None:
+                statements.append(self.label_rule(rule_id, trace_rule, rule_ast.body, parameters))
+        return statements
 
     def translate_rule(self, rule_ast):
+        if rule_ast.ast_type == ast.ASTType.Program:
+            self._parameters = tuple(p.name for p in rule_ast.parameters)
+            self.add_to_translation(rule_ast)
+            return
         self.add_comment_to_translation(rule_ast)
         if rule_ast.ast_type == ast.ASTType.Rule and not is_constraint(rule_ast):
             if is_xclingo_label(rule_ast):
@@ -315,9 +444,11 @@ class Preprocessor:
                     return
                 self.add_to_translation(self.label_atom(rule_ast))
             elif is_xclingo_show_trace(rule_ast):
+                self._traced.add(term_signature(rule_ast.head.atom.symbol.arguments[0]))
                 self.add_to_translation(self.show_trace(rule_ast))
-                pass
             elif is_xclingo_mute(rule_ast):
+                if is_full_mute(rule_ast):
+                    self._muted.add(term_signature(rule_ast.head.atom.symbol.arguments[0]))
                 self.add_to_translation(self.mute(rule_ast))
             else:
                 rule_id = self.increment_rule_count()
@@ -331,29 +462,77 @@ class Preprocessor:
                             cond_lit.literal,
                             list(cond_lit.condition) + list(rule_ast.body),
                         )
-                        self.add_to_translation(self.support_rule(rule_id, false_rule))
-                        self.add_to_translation(self.fbody_rule(rule_id, false_rule))
-                        if self._last_trace_rule is not None:
-                            self.add_to_translation(
-                                self.label_rule(rule_id, self._last_trace_rule, false_rule.body)
-                            )
-                    if self._last_trace_rule is not None:
-                        self._last_trace_rule = None
+                        self.add_rule_to_translation(rule_id, false_rule, self._last_trace_rule)
                 else:  # Other cases
-                    self.add_to_translation(self.support_rule(rule_id, rule_ast))
-                    self.add_to_translation(self.fbody_rule(rule_id, rule_ast))
-                    if self._last_trace_rule is not None:
-                        self.add_to_translation(
-                            self.label_rule(rule_id, self._last_trace_rule, rule_ast.body)
-                        )
-                        self._last_trace_rule = None
+                    self.add_rule_to_translation(rule_id, rule_ast, self._last_trace_rule)
+                self._last_trace_rule = None
 
-    def translate_program(self, program, name=""):
-        self._translation += "%" * 8 + name + "%" * 8 + "\n"
-        ast.parse_string(
-            Preprocessor.translate_annotations(program),
-            lambda ast: self.translate_rule(ast),
-        )
+    def translate_program(self, program, name="base", parameters=()):
+        """Translates a program which is added to the part name(parameters), as clingo.Control.add does. The
+        #program directives inside the program are kept in the translation."""
+        self._translation.append("%" * 8 + name + "%" * 8)
+        program, annotations = scan_annotations(program)
+        self.malformed_annotations.extend((name, a) for a in annotations if a.kind is None)
+        header = []
+
+        def translate(statement):
+            # The parser always starts with an implicit '#program base.': the rules up to the first #program
+            # directive belong to the part given by name and parameters
+            if not header:
+                loc = statement.location
+                header.append(ast.Program(loc, name, [ast.Id(loc, p) for p in parameters]))
+                self.translate_rule(header[0])
+            else:
+                self.translate_rule(statement)
+
+        ast.parse_string(program, translate)
+
+    def relevant_signatures(self):
+        """Returns the signatures of the atoms which may appear in the explanation of a traced atom, or None if every
+        atom may. They are the predicates reachable backwards from the %!show_trace ones in the dependency graph of
+        the rules, without going through the predicates muted as a whole."""
+        if None in self._traced:
+            return None
+        dependencies = dict()
+        for item in self._translation:
+            if isinstance(item, _UserRule):
+                head, body = item.signatures
+                if head is None or None in body:
+                    return None
+                dependencies.setdefault(head, set()).update(body)
+
+        relevant = set(self._traced)
+        stack = list(relevant)
+        while stack:
+            signature = stack.pop()
+            if signature in self._muted:
+                continue
+            for dependency in dependencies.get(signature, ()):
+                if dependency not in relevant:
+                    relevant.add(dependency)
+                    stack.append(dependency)
+        return relevant
+
+    def _sliced_translation(self):
+        relevant = self.relevant_signatures()
+        for item in self._translation:
+            if isinstance(item, _UserRule):
+                head = item.signatures[0]
+                if relevant is None or head in relevant:
+                    muted = head in self._muted
+                    statements = item.translations.get(muted, None)
+                    if statements is None:
+                        statements = item.translations[muted] = self.rule_translation(item, muted=muted)
+                    yield from statements
+            else:
+                yield item
 
     def get_translation(self):
-        return self._translation
+        """Returns the translation as a string, including the original rules as comments. Only the rules relevant to
+        the %!show_trace annotations are translated."""
+        return "".join(f"{a}\n" for a in self._sliced_translation())
+
+    def get_translation_ast(self):
+        """Returns the list of AST statements of the translation. Only the rules relevant to the %!show_trace
+        annotations are translated."""
+        return [a for a in self._sliced_translation() if not isinstance(a, str)]
@@ -1,5 +1,106 @@
 import re
+from collections import namedtuple
+from functools import lru_cache
 from clingo import ast
+from clingo.symbol import SymbolType
+
+
+Annotation = namedtuple("Annotation", ["kind", "line", "column", "text"])
+
+_ANNOTATION_PATTERN = re.compile(
+    r"%!(?:"
+    r'(?P<trace_rule>trace_rule \{(?P<trace_rule_text>".*")(?:,(?P<trace_rule_parameters>.*))?\}[ ]*[\n ]*)'
+    r"|"
+    r'(?P<trace>trace \{(?P<trace_text>".*")(?:,(?P<trace_parameters>.*))?\} '
+    r"(?P<trace_head>\-?[_a-z][_a-zA-Z0-9]*(?:\((?:[\-\+a-zA-Z0-9 \(\)\,\_])+\))?)"
+    r"(?:[ ]*:[ ]*(?P<trace_body>.*))?\.)"
+    r"|"
+    r"(?P<show_trace>show_trace (?P<show_trace_sign>\-)?"
+    r"(?P<show_trace_head>[_a-z][_a-zA-Z0-9]*(?:\((?:[\-a-zA-Z0-9 \(\)\,\_])+\))?)"
+    r"(?:[ ]*:[ ]*(?P<show_trace_body>.*))?\.)"
+    r"|"
+    r"(?P<mute>mute (?P<mute_sign>\-)?"
+    r"(?P<mute_head>[_a-z][_a-zA-Z0-9]*(?:\((?:[\-a-zA-Z0-9 \(\)\,\_])+\))?)"
+    r"(?:[ ]*:[ ]*(?P<mute_body>.*))?\.)"
+    r"|"
+    r"(?P<unknown>[^\n]*)"
+    r")"
+)
+
+ANNOTATION_KINDS = ("trace_rule", "trace", "show_trace", "mute")
+
+
+def _rewrite_annotation(kind, match):
+    if kind == "trace_rule":
+        return "{name}(id, ({text}, ({parameters},) )).\n".format(
+            text=match.group("trace_rule_text"),
+            parameters=match.group("trace_rule_parameters") or "",
+            name="_xclingo_label",
+        )
+    if kind == "trace":
+        return "{name}({head}, ({text}, ({parameters},)) ){body}.".format(
+            head=match.group("trace_head"),
+            text=match.group("trace_text"),
+            parameters=match.group("trace_parameters") or "",
+            body=(" :- " + match.group("trace_body")) if match.group("trace_body") else "",
+            name="_xclingo_label",
+        )
+    # show_trace and mute share their syntax
+    return "{name}({classic_negation}{head}){body}.".format(
+        name="_xclingo_show_trace" if kind == "show_trace" else "_xclingo_muted",
+        head=match.group(f"{kind}_head"),
+        classic_negation="-" if match.group(f"{kind}_sign") else "",
+        body=" :- " + match.group(f"{kind}_body") if match.group(f"{kind}_body") else "",
+    )
+
+
+def scan_annotations(program, kinds=ANNOTATION_KINDS):
+    """
+    Rewrites, in a single pass over the program, the '%!' magic comments of the given kinds into their rule version.
+    Magic comments which do not match any of the annotations are left untouched and reported with kind None, unless
+    they appear inside another comment.
+    @param str program: the program that is intended to be modified.
+    @param Iterable[str] kinds: the kinds of annotations to be rewritten.
+    @return Tuple[str, List[Annotation]]: the rewritten program and the found annotations with their position
+    (1-based line and column) in the given program.
+    """
+    chunks = []
+    annotations = []
+    last_end = 0
+    line, line_start = 1, 0
+    for match in _ANNOTATION_PATTERN.finditer(program):
+        start = match.start()
+        newline = program.rfind("\n", last_end, start)
+        if newline != -1:
+            line += program.count("\n", last_end, start)
+            line_start = newline + 1
+        kind = match.lastgroup if match.lastgroup != "unknown" else None
+        # a '%!' inside an ordinary comment is just text, not an annotation
+        if kind is not None or program.rfind("%", line_start, start) == -1:
+            annotations.append(Annotation(kind, line, start - line_start + 1, match.group(0)))
+
+        chunks.append(program[last_end:start])
+        if kind in kinds:
+            chunks.append(_rewrite_annotation(kind, match))
+        else:
+            chunks.append(match.group(0))
+
+        last_end = match.end()
+        newlines = match.group(0).count("\n")
+        if newlines:
+            line += newlines
+            line_start = match.group(0).rfind("\n") + start + 1
+    chunks.append(program[last_end:])
+    return "".join(chunks), annotations
+
+
+def translate_annotations(program):
+    """
+    Replaces all the magic comments in the given program for their rule version.
+    @param str program: the program that is intended to be modified.
+    @return str:
+    """
+    return scan_annotations(program)[0]
 
 
 def translate_trace(program):
@@ -8,16 +109,7 @@ def translate_trace(program):
     @param str program: the program that is intended to be modified.
     @return str:
     """
-    for hit in re.findall('(%!trace_rule \{(".*")(?:,(.*))?\}[ ]*[\n ]*)', program):
-        # 0: original match  1: label text  2: label parameters  3: head of the rule  4: body of the rule
-        program = program.replace(
-            hit[0],
-            "{name}(id, @label({text}, ({parameters},) )).\n".format(
-                text=hit[1], parameters=hit[2] if hit[2] else "", name="_xclingo_label"
-            ),
-        )
-
-    return program
+    return scan_annotations(program, kinds=("trace_rule",))[0]
 
 
 def translate_trace_all(program):
@@ -26,23 +118,7 @@ def translate_trace_all(program):
     @param str program: the program that is intended to be modified
     @return str:
     """
-    for hit in re.findall(
-        '(%!trace \{(".*")(?:,(.*))?\} (\-?[_a-z][_a-zA-Z0-9]*(?:\((?:[\-\+a-zA-Z0-9 \(\)\,\_])+\))?)(?:[ ]*:[ ]*(.*))?\.)',
-        program,
-    ):
-        # 0: original match 1: "label" 2:v1,v2  3: head  4: body.
-        program = program.replace(
-            hit[0],
-            "{name}({head}, @label({text}, ({parameters},)) ){body}.".format(
-                head=hit[3],
-                text=hit[1],
-                parameters=hit[2],
-                body=(" :- " + hit[4]) if hit[4] else "",
-                name="_xclingo_label",
-            ),
-        )
-
-    return program
+    return scan_annotations(program, kinds=("trace",))[0]
 
 
 def translate_show_all(program):
@@ -51,23 +127,7 @@ def translate_show_all(program):
     @param str program:
     @return:
     """
-    for hit in re.findall(
-        "(%!show_trace ((\-)?([_a-z][_a-zA-Z0-9]*(?:\((?:[\-a-zA-Z0-9 \(\)\,\_])+\))?)(?:[ ]*:[ ]*(.*))?\.))",
-        program,
-    ):
-        # 0: original match  1: rule  2: negative_sign  3: head of the rule  4: body of the rule
-        program = program.replace(
-            hit[0],
-            "{name}({classic_negation}{head}){body}.".format(
-                sign="" if not hit[2] else "n",
-                name="_xclingo_show_trace",
-                head=hit[3],
-                classic_negation="" if not hit[2] else "-",
-                body=" :- " + hit[4] if hit[4] else "",
-            ),
-        )
-
-    return program
+    return scan_annotations(program, kinds=("show_trace",))[0]
 
 
 def translate_mute(program):
@@ -76,23 +136,7 @@ def translate_mute(program):
     @param str program:
     @return:
     """
-    for hit in re.findall(
-        "(%!mute ((\-)?([_a-z][_a-zA-Z0-9]*(?:\((?:[\-a-zA-Z0-9 \(\)\,\_])+\))?)(?:[ ]*:[ ]*(.*))?\.))",
-        program,
-    ):
-        # 0: original match  1: rule  2: negative_sign  3: head of the rule  4: body of the rule
-        program = program.replace(
-            hit[0],
-            "{name}({classic_negation}{head}){body}.".format(
-                sign="" if not hit[2] else "n",
-                name="_xclingo_muted",
-                head=hit[3],
-                classic_negation="" if not hit[2] else "-",
-                body=" :- " + hit[4] if hit[4] else "",
-            ),
-        )
-
-    return program
+    return scan_annotations(program, kinds=("mute",))[0]
 
 
 def is_constraint(rule_ast):
@@ -143,3 +187,142 @@ def is_choice_rule(rule_ast):
 
 def is_disyunctive_head(rule_ast):
     return rule_ast.head.ast_type == ast.ASTType.Disjunction
+
+
+def term_signature(term):
+    """
+    Returns the signature of the atom represented by the given term as a (name, arity, positive) tuple, or None if the
+    term may stand for atoms of different signatures (a variable, for instance).
+    @param ast.AST term: the term.
+    @return:
+    """
+    if term.ast_type == ast.ASTType.UnaryOperation and term.operator_type == ast.UnaryOperator.Minus:
+        signature = term_signature(term.argument)
+        return None if signature is None else signature[:2] + (not signature[2],)
+    if term.ast_type == ast.ASTType.Function:
+        return (term.name, len(term.arguments), True)
+    if term.ast_type == ast.ASTType.SymbolicTerm and term.symbol.type == SymbolType.Function:
+        return (term.symbol.name, len(term.symbol.arguments), term.symbol.positive)
+    return None
+
+
+def body_signatures(lit_list):
+    """
+    Yields the signatures of the atoms which appear positively in the given body, including the conditions of
+    aggregate elements.
+    @param Iterable[ast.AST] lit_list: the body of a rule.
+    @return:
+    """
+    for lit in lit_list:
+        if lit.ast_type != ast.ASTType.Literal:
+            continue
+        if lit.atom.ast_type == ast.ASTType.SymbolicAtom:
+            if lit.sign == ast.Sign.NoSign:
+                yield term_signature(lit.atom.symbol)
+        elif lit.atom.ast_type == ast.ASTType.BodyAggregate:
+            for element in lit.atom.elements:
+                yield from body_signatures(element.condition)
+
+
+class _Variables(ast.Transformer):
+    def __init__(self):
+        self.names = dict()
+
+    def visit_Variable(self, variable):
+        if variable.name != "_":
+            self.names[variable.name] = None
+        return variable
+
+
+def variable_names(terms):
+    """
+    Returns the names of the (non anonymous) variables in the given terms, in order of appearance.
+    @param Iterable[ast.AST] terms: the terms.
+    @return List[str]:
+    """
+    collector = _Variables()
+    for term in terms:
+        collector.visit(term)
+    return list(collector.names)
+
+
+class _AnonymousVariables(ast.Transformer):
+    def __init__(self):
+        self.count = 0
+
+    def visit_Variable(self, variable):
+        if variable.name != "_":
+            return variable
+        self.count += 1
+        return ast.Variable(variable.location, f"_XclingoAnon{self.count}")
+
+
+def name_anonymous_variables(rule_ast):
+    """
+    Gives a name to the anonymous variables in the positive atoms of the body of a rule, since the variables of those
+    atoms are used to tell the instances of the rule apart.
+    @param ast.AST rule_ast: the rule.
+    @return ast.AST: the rule, or a copy of it with the new variable names.
+    """
+    renamer = _AnonymousVariables()
+    body = [
+        renamer.visit(lit)
+        if lit.ast_type == ast.ASTType.Literal
+        and lit.sign == ast.Sign.NoSign
+        and lit.atom.ast_type == ast.ASTType.SymbolicAtom
+        else lit
+        for lit in rule_ast.body
+    ]
+    return ast.Rule(rule_ast.location, rule_ast.head, body) if renamer.count > 0 else rule_ast
+
+
+class _ModelSignatures(ast.Transformer):
+    def __init__(self):
+        self.signatures = set()
+
+    def visit_Function(self, function):
+        if function.name == "_xclingo_model" and len(function.arguments) == 1:
+            signature = term_signature(function.arguments[0])
+            self.signatures.add(None if signature is None else signature[:2])
+            return function
+        return function.update(**self.visit_children(function))
+
+
+@lru_cache(maxsize=2 ** 16)
+def _statement_model_signatures(statement):
+    # The statements of the rules already translated are reused by the next translations (see Preprocessor.copy)
+    collector = _ModelSignatures()
+    collector.visit(statement)
+    return frozenset(collector.signatures)
+
+
+def model_signatures(statements):
+    """
+    Collects the (name, arity) signatures of the atoms used through _xclingo_model/1 in the given statements. Classical
+    negation is ignored.
+    @param Iterable[ast.AST] statements: the translated program.
+    @return: the set of signatures, or None if some _xclingo_model/1 argument can match atoms of any signature.
+    """
+    signatures = set()
+    for statement in statements:
+        signatures.update(_statement_model_signatures(statement))
+    return None if None in signatures else signatures
+
+
+def is_full_mute(rule_ast):
+    # Precondition: is_xclingo_mute(rule_ast) == True
+    # True if every atom of the muted predicate is muted: no body and only distinct variables as arguments
+    term = rule_ast.head.atom.symbol.arguments[0]
+    if term.ast_type == ast.ASTType.UnaryOperation:
+        term = term.argument
+    if len(rule_ast.body) > 0:
+        return False
+    if term.ast_type == ast.ASTType.SymbolicTerm:
+        # A propositional atom, e.g. '%!mute b.'
+        return term.symbol.type == SymbolType.Function and len(term.symbol.arguments) == 0
+    if term.ast_type != ast.ASTType.Function:
+        return False
+    names = [a.name for a in term.arguments if a.ast_type == ast.ASTType.Variable]
+    return len(names) == len(term.arguments) and all(
+        names.count(name) == 1 for name in names if name != "_"
+    )